@@ -1,6 +1,10 @@
 from flask import Blueprint
 from flask_restful import Api
-from App.Api.wrapper.api import CreateRuleResource, CombineRulesResource, EvaluateRuleResource, GetAllRulesResource
+from App.Api.wrapper.api import (
+    CreateRuleResource, ImportRulesResource, CombineRulesResource, EvaluateRuleResource, EvaluateRuleBatchResource,
+    EvaluateRuleStreamResource, MatchRulesResource, GetAllRulesResource, RuleCacheStatsResource,
+    EvaluationStatsResource, MetricsResource
+)
 
 route = Blueprint('route', __name__)
 api_v1 = Api(route)
@@ -8,8 +12,22 @@ api_v1 = Api(route)
 # New routes
 api_v1.add_resource(CreateRuleResource, '/create')
 
+api_v1.add_resource(ImportRulesResource, '/import')
+
 api_v1.add_resource(CombineRulesResource, '/combine_rules')
 
 api_v1.add_resource(EvaluateRuleResource, '/eval')
 
-api_v1.add_resource(GetAllRulesResource, '/getRules')
\ No newline at end of file
+api_v1.add_resource(EvaluateRuleBatchResource, '/eval/batch')
+
+api_v1.add_resource(EvaluateRuleStreamResource, '/eval/stream')
+
+api_v1.add_resource(MatchRulesResource, '/match')
+
+api_v1.add_resource(GetAllRulesResource, '/getRules')
+
+api_v1.add_resource(RuleCacheStatsResource, '/eval/cache')
+
+api_v1.add_resource(EvaluationStatsResource, '/eval/stats')
+
+api_v1.add_resource(MetricsResource, '/metrics')
\ No newline at end of file
@@ -0,0 +1,156 @@
+from threading import Lock
+from App.Api.wrapper.constants import ElemType
+
+
+class NodeStats:
+
+    def __init__(self):
+        self.calls = 0
+        self.true = 0
+        self.cost = 0
+
+    def probability(self, outcome):
+        # Laplace-smoothed, so unseen branches start at 0.5
+        hits = self.true if outcome else self.calls - self.true
+        return (hits + 1) / (self.calls + 2)
+
+    def average_cost(self):
+        return self.cost / self.calls if self.calls else 1.0
+
+
+# Short-circuiting evaluator for one rule that learns, per subtree, how
+# often it is true and how many comparisons it costs. An AND runs first the
+# operand most likely to be false per unit of cost, an OR the one most
+# likely to be true, so the decisive cheap branch usually ends the node.
+# Counters are updated without a lock; under concurrency they are
+# approximate, which only affects the ordering heuristic.
+class AdaptiveEvaluator:
+
+    def __init__(self, root, compare):
+        self.root = root
+        self.compare = compare
+        self.evaluations = 0
+        self.comparisons = 0
+        self.total_comparisons = count_comparisons(root)
+        self.stats = {}
+
+    def evaluate(self, conditions):
+        result, cost = self._evaluate(self.root, conditions)
+        self.evaluations += 1
+        self.comparisons += cost
+        return result
+
+    def _node_stats(self, node):
+        stats = self.stats.get(node['id'])
+        if stats is None:
+            stats = self.stats[node['id']] = NodeStats()
+        return stats
+
+    def _ordered_operands(self, node, decisive):
+        operands = [node['left'], node['right']]
+        scores = []
+        for operand in operands:
+            stats = self._node_stats(operand) if operand else NodeStats()
+            scores.append(stats.probability(decisive) / max(stats.average_cost(), 1.0))
+        if scores[1] > scores[0]:
+            operands.reverse()
+        return operands
+
+    def _evaluate(self, root, conditions):
+        # Returns (result, comparisons evaluated). Logical nodes are frames
+        # on an explicit stack, so deep rules evaluate without recursion:
+        # [operands in evaluation order, position, decisive outcome, cost]
+        frames = []
+        node = root
+        while True:
+            # Descend to the first operand of every logical node
+            while node and node['elem_type'] == ElemType['LOGICAL'] and node['value'].lower() in ('and', 'or'):
+                # AND is decided by a False operand, OR by a True one
+                decisive = node['value'].lower() == 'or'
+                operands = self._ordered_operands(node, decisive)
+                frames.append([operands, 0, decisive, 0])
+                node = operands[0]
+
+            if not node:
+                result, cost = False, 0
+            elif node['elem_type'] == ElemType['COMPARISON']:
+                result, cost = self.compare(node, conditions), 1
+            else:
+                result, cost = True, 0
+
+            # Hand results up until a node still has an operand to run
+            while frames:
+                frame = frames[-1]
+                operands, position, decisive = frame[0], frame[1], frame[2]
+                operand = operands[position]
+                if operand:
+                    stats = self._node_stats(operand)
+                    stats.calls += 1
+                    stats.true += bool(result)
+                    stats.cost += cost
+                frame[3] += cost
+                if bool(result) == decisive or position == 1:
+                    frames.pop()
+                    cost = frame[3]
+                    continue
+                frame[1] = 1
+                node = operands[1]
+                break
+            else:
+                return result, cost
+
+    def report(self):
+        evaluated = self.evaluations * self.total_comparisons
+        return {
+            'evaluations': self.evaluations,
+            'comparisons_evaluated': self.comparisons,
+            'comparisons_without_short_circuit': evaluated,
+            'comparisons_saved': 1 - self.comparisons / evaluated if evaluated else 0.0,
+            'nodes': [
+                {
+                    'id': node_id,
+                    'calls': stats.calls,
+                    'true': stats.true,
+                    'false': stats.calls - stats.true,
+                    'average_cost': stats.average_cost(),
+                }
+                for node_id, stats in self.stats.items()
+            ],
+        }
+
+
+def count_comparisons(node):
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if not node:
+            continue
+        if node['elem_type'] == ElemType['COMPARISON']:
+            count += 1
+        else:
+            stack.extend((node['left'], node['right']))
+    return count
+
+
+# Evaluators keyed by rule name. Statistics are keyed by node id, so they
+# survive the cached tree being reloaded after a cache invalidation.
+class AdaptiveRegistry:
+
+    def __init__(self):
+        self._evaluators = {}
+        self._lock = Lock()
+
+    def get(self, rule_name, root, compare):
+        with self._lock:
+            evaluator = self._evaluators.get(rule_name)
+            if evaluator is None:
+                evaluator = self._evaluators[rule_name] = AdaptiveEvaluator(root, compare)
+            elif evaluator.root is not root:
+                evaluator.root = root
+            return evaluator
+
+    def report(self, rule_name):
+        with self._lock:
+            evaluator = self._evaluators.get(rule_name)
+        return evaluator.report() if evaluator else None
@@ -1,7 +1,9 @@
-from flask import request, jsonify
+from flask import request, jsonify, Response, stream_with_context
 from flask_restful import Resource
+from App import metrics
 from App.Api.wrapper.utils import (
-    create_rule, combine_rules, get_all_rules, evaluate_rule
+    create_rule, combine_rules, import_rules, get_all_rules, evaluate_rule, evaluate_rule_batch, evaluate_rule_stream,
+    match_rules, get_rule_cache_stats, get_evaluation_stats
 )
 
 
@@ -16,6 +18,17 @@ class CreateRuleResource(Resource):
             return jsonify({"error": "Internal Server Error"}), 500
 
 
+class ImportRulesResource(Resource):
+    def post(self):
+        try:
+            data = request.get_json()
+            response, status_code = import_rules(data)
+            return response, status_code
+        except Exception as e:
+            print(f"Error importing rules: {str(e)}")
+            return jsonify({"error": "Internal Server Error"}), 500
+
+
 class CombineRulesResource(Resource):
     def post(self):
         try:
@@ -37,10 +50,78 @@ class EvaluateRuleResource(Resource):
             return jsonify({'error': 'Internal Server Error'}), 500
 
 
+class EvaluateRuleBatchResource(Resource):
+    def post(self):
+        try:
+            data = request.get_json()
+            response, status_code = evaluate_rule_batch(data)
+            return response, status_code
+        except Exception as e:
+            print(f"Error evaluating Rule batch: {e}")
+            return jsonify({'error': 'Internal Server Error'}), 500
+
+
+class EvaluateRuleStreamResource(Resource):
+    # Body: newline-delimited JSON conditions, one record per line
+    def post(self):
+        try:
+            lines, response, status_code = evaluate_rule_stream(
+                request.args.get('rule_name'),
+                request.stream,
+                request.args.get('chunk_size', type=int)
+            )
+            if lines is None:
+                return response, status_code
+            return Response(stream_with_context(lines), status=status_code, mimetype='application/x-ndjson')
+        except Exception as e:
+            print(f"Error streaming Rule evaluation: {e}")
+            return jsonify({'error': 'Internal Server Error'}), 500
+
+
+class MatchRulesResource(Resource):
+    def post(self):
+        try:
+            data = request.get_json()
+            response, status_code = match_rules(data)
+            return response, status_code
+        except Exception as e:
+            print(f"Error matching Rules: {e}")
+            return jsonify({'error': 'Internal Server Error'}), 500
+
+
 class GetAllRulesResource(Resource):
     def get(self):
         try:
-            response_data, status_code = get_all_rules()
+            response_data, status_code, headers = get_all_rules(request.args, request.if_none_match)
+            if status_code == 304:
+                return Response(status=304, headers=headers)
+            return response_data, status_code, headers
+        except Exception as e:
+            return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
+
+
+class RuleCacheStatsResource(Resource):
+    def get(self):
+        try:
+            response_data, status_code = get_rule_cache_stats()
+            return response_data, status_code
+        except Exception as e:
+            return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
+
+
+class EvaluationStatsResource(Resource):
+    def get(self):
+        try:
+            response_data, status_code = get_evaluation_stats(request.args.get('rule_name'))
             return response_data, status_code
         except Exception as e:
             return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
+
+
+class MetricsResource(Resource):
+    def get(self):
+        try:
+            return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+        except Exception as e:
+            print(f"Error rendering metrics: {e}")
+            return jsonify({'error': 'Internal Server Error'}), 500
@@ -0,0 +1,129 @@
+import logging
+import re
+from App.Api.wrapper.constants import ElemType
+from App.Api.wrapper.coercion import coerce_value, coerce_attribute, compare_typed
+
+logger = logging.getLogger(__name__)
+
+# Rule tokens that may be looked up in the conditions
+ATTRIBUTE_NAME_PATTERN = re.compile(r"\w+")
+
+# The only operators that are ever written into generated source
+PYTHON_OPERATORS = {
+    '>': '>',
+    '<': '<',
+    '=': '==',
+    '<=': '<=',
+    '>=': '>=',
+}
+
+
+class CodegenError(Exception):
+    pass
+
+
+# Turns a rule's AST into the source of one Python function and compiles
+# it into a real code object. The generated source only ever contains
+# generated identifiers, slot numbers and operators from PYTHON_OPERATORS:
+# attribute names, constants and declared types reach the function through
+# closure variables, so no rule text is ever executed. AND/OR chains are
+# flattened into Python's own short-circuiting `and`/`or`.
+class RuleCodegen:
+
+    def __init__(self, root, schema=None):
+        self.root = root
+        self.schema = schema
+        self.names = []
+        self.slots = {}
+
+    def _slot(self, token):
+        if not isinstance(token, str) or not ATTRIBUTE_NAME_PATTERN.fullmatch(token):
+            raise CodegenError(f"Token {token!r} is not a valid attribute name or literal")
+        if token not in self.slots:
+            self.slots[token] = len(self.names)
+            self.names.append(token)
+        return self.slots[token]
+
+    def _is_attribute(self, slot):
+        return not self.schema or self.names[slot] in self.schema
+
+    def _comparison(self, node):
+        operator = PYTHON_OPERATORS.get(node['value'])
+        if operator is None:
+            return 'False'
+        left = self._slot(node['left']['value'])
+        right = self._slot(node['right']['value'])
+
+        if not self._is_attribute(left) and not self._is_attribute(right):
+            # Both sides are literals: fold the comparison now
+            constant = compare_typed(node['value'], coerce_value(self.names[left]), coerce_value(self.names[right]))
+            return 'True' if constant else 'False'
+
+        return (
+            f"((n{left} {operator} n{right}) if n{left} is not None and n{right} is not None "
+            f"else (n{left} is None and s{left} is not None and s{right} is not None and s{left} {operator} s{right}))"
+        )
+
+    def _expression(self, node):
+        if not node:
+            return 'False'
+        if node['elem_type'] == ElemType['COMPARISON']:
+            return self._comparison(node)
+        if node['elem_type'] == ElemType['LOGICAL'] and node['value'].lower() in ('and', 'or'):
+            operator = node['value'].lower()
+            # Collect the operands of the whole same-operator chain so long
+            # combined rules do not turn into deeply nested parentheses
+            operands = []
+            pending = [node]
+            while pending:
+                current = pending.pop()
+                if current and current['elem_type'] == ElemType['LOGICAL'] and current['value'].lower() == operator:
+                    pending.append(current['right'])
+                    pending.append(current['left'])
+                else:
+                    operands.append(self._expression(current))
+            return '(' + f' {operator} '.join(operands) + ')'
+        return 'True'
+
+    def source(self):
+        expression = self._expression(self.root)
+
+        lines = ['def make_rule(NAMES, CONSTANTS, TYPES, coerce_attribute):']
+        for slot in range(len(self.names)):
+            if self._is_attribute(slot):
+                lines.append(f'    k{slot} = NAMES[{slot}]')
+                lines.append(f'    c{slot} = CONSTANTS[{slot}]')
+                lines.append(f'    t{slot} = TYPES[{slot}]')
+            else:
+                # Pure literals are typed once, here, and read from the closure
+                lines.append(f'    n{slot}, s{slot} = CONSTANTS[{slot}]')
+        lines.append('    def evaluate(conditions):')
+        for slot in range(len(self.names)):
+            if self._is_attribute(slot):
+                lines.append(f'        n{slot}, s{slot} = coerce_attribute(k{slot}, conditions[k{slot}], t{slot}) if k{slot} in conditions else c{slot}')
+        lines.append(f'        return bool({expression})')
+        lines.append('    return evaluate')
+        return '\n'.join(lines) + '\n'
+
+    def compile(self, filename='<rule>'):
+        source = self.source()
+        namespace = {}
+        exec(compile(source, filename, 'exec'), {'__builtins__': {'bool': bool}}, namespace)
+        schema = self.schema or {}
+        return namespace['make_rule'](
+            tuple(self.names),
+            tuple(coerce_value(name) for name in self.names),
+            tuple(schema.get(name) for name in self.names),
+            coerce_attribute
+        )
+
+
+def compile_function(root, schema=None, rule_name='rule'):
+    # Returns None when the rule cannot be compiled safely (unexpected
+    # tokens, or nesting too deep for the Python compiler); callers then
+    # fall back to the VM
+    try:
+        return RuleCodegen(root, schema).compile(f'<rule:{rule_name}>')
+    except (CodegenError, SyntaxError, RecursionError, MemoryError) as error:
+        logger.warning(f"Falling back to the VM for rule '{rule_name}': {error}")
+        return None
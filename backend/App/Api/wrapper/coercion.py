@@ -0,0 +1,131 @@
+import re
+
+# The strings float() accepts, so numbers are recognised without relying on
+# a ValueError per comparison. float() strips whitespace except the
+# separators U+001C-U+001F, which \s would match.
+NUMBER_PATTERN = re.compile(
+    r"[^\S\x1c-\x1f]*[+-]?(?:(?:\d+(?:_\d+)*(?:\.(?:\d+(?:_\d+)*)?)?|\.\d+(?:_\d+)*)(?:[eE][+-]?\d+(?:_\d+)*)?"
+    r"|inf(?:inity)?|nan)[^\S\x1c-\x1f]*",
+    re.IGNORECASE
+)
+
+# Stands in for an attribute that is absent from the conditions. Pickled by
+# reference, so it stays the same object in evaluation pool workers.
+class _Missing:
+
+    def __repr__(self):
+        return 'MISSING'
+
+    def __reduce__(self):
+        return 'MISSING'
+
+
+MISSING = _Missing()
+
+NUMBER = 'number'
+STRING = 'string'
+ATTRIBUTE_TYPES = (NUMBER, STRING)
+
+
+def to_float(value):
+    # float(value) for numbers and numeric strings, None for anything else
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str) and NUMBER_PATTERN.fullmatch(value):
+        return float(value)
+    return None
+
+
+def coerce_value(value):
+    # Typed form of a value: (number or None, lowercase string or None)
+    return to_float(value), value.lower() if isinstance(value, str) else None
+
+
+def coerce_typed(value, attribute_type):
+    # Coercion for an attribute declared in the schema; a value that does
+    # not fit the declared type raises ValueError once, at binding time
+    if attribute_type == NUMBER:
+        number = to_float(value)
+        if number is None:
+            raise ValueError(f"expected a number, got {value!r}")
+        return number, None
+    if attribute_type == STRING:
+        if not isinstance(value, str):
+            raise ValueError(f"expected a string, got {value!r}")
+        return None, value.lower()
+    return coerce_value(value)
+
+
+def coerce_attribute(name, value, attribute_type):
+    # coerce_typed with the attribute named in the error, as /eval reports it
+    try:
+        return coerce_typed(value, attribute_type)
+    except ValueError as error:
+        raise ValueError(f"Invalid value for '{name}': {error}")
+
+
+def bind_attributes(conditions, names, schema=None):
+    # Typed values of the attributes among `names` that the conditions
+    # provide, bound as the VM binds them: with a schema only declared names
+    # are attributes, and a value that does not fit its type raises ValueError
+    bound = {}
+    for name in names:
+        if name in conditions and (not schema or name in schema):
+            bound[name] = coerce_attribute(name, conditions[name], schema.get(name) if schema else None)
+    return bound
+
+
+def bound_value(bound, token):
+    # A token that is not a bound attribute stands for itself
+    value = bound.get(token)
+    return coerce_value(token) if value is None else value
+
+
+def compare_bound(operator, left, right, bound):
+    return compare_typed(operator, bound_value(bound, left), bound_value(bound, right))
+
+
+def typed_operands(left, right):
+    # Values compare as numbers when both sides are numbers and as lowercase
+    # strings when the left side is not a number (the rules of the original
+    # float()-then-lower() evaluator); any other mix is not comparable
+    left_number, left_string = left
+    right_number, right_string = right
+    if left_number is not None and right_number is not None:
+        return left_number, right_number
+    if left_number is None and left_string is not None and right_string is not None:
+        return left_string, right_string
+    return None
+
+
+def compare_typed(operator, left, right):
+    operands = typed_operands(left, right)
+    if operands is None:
+        return False
+    left_value, right_value = operands
+
+    if operator == '>':
+        return left_value > right_value
+    elif operator == '<':
+        return left_value < right_value
+    elif operator == '=':
+        return left_value == right_value
+    elif operator == '<=':
+        return left_value <= right_value
+    elif operator == '>=':
+        return left_value >= right_value
+    return False
+
+
+def compare_values(operator, left_value, right_value):
+    return compare_typed(operator, coerce_value(left_value), coerce_value(right_value))
+
+
+def validate_schema(schema):
+    # Attribute names are matched against lowercase rule tokens
+    normalized = {}
+    for attribute, attribute_type in (schema or {}).items():
+        if attribute_type not in ATTRIBUTE_TYPES:
+            raise ValueError(f"Unknown type {attribute_type!r} for attribute {attribute!r}")
+        normalized[attribute.lower()] = attribute_type
+    return normalized
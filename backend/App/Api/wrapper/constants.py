@@ -0,0 +1,19 @@
+PRECEDENCE = {
+    '(': -1,
+    ')': -1,
+    'or': 1,
+    'and': 1,
+    '<': 2,
+    '>': 2,
+    '=': 2,
+    '<=': 2,
+    '>=': 2,
+}
+
+ElemType = {
+    'LOGICAL': 1,
+    'COMPARISON': 2,
+    'STRING': 3,
+    'INTEGER': 4,
+    'VARIABLE': 5,
+}
@@ -0,0 +1,217 @@
+import math
+from bisect import bisect_left, bisect_right
+from threading import Lock
+from App.Api.wrapper.constants import ElemType
+from App.Api.wrapper.coercion import bind_attributes, compare_bound, to_float
+
+COMPARISON = 'cmp'
+AND = 'and'
+OR = 'or'
+TRUE = 'true'
+FALSE = 'false'
+
+# `30 < age` is indexed as `age > 30`
+FLIPPED = {'<': '>', '>': '<', '<=': '>=', '>=': '<=', '=': '='}
+
+
+def to_number(token):
+    number = to_float(token)
+    return number if number is not None and math.isfinite(number) else None
+
+
+# Sorted thresholds of every numeric predicate on one attribute. For a
+# record value x, a single bisect over the distinct thresholds gives the
+# interval [lo, hi) of thresholds equal to x. A threshold t with rank r
+# then satisfies x > t iff r < lo, x >= t iff r < hi, x < t iff r >= hi,
+# x <= t iff r >= lo and x = t iff lo <= r < hi. Per operator the node
+# lists are sorted by rank, so each of those sets is one contiguous slice.
+class ThresholdIndex:
+
+    def __init__(self):
+        self.entries = []
+        self._built = None
+
+    def add(self, threshold, operator, node_index):
+        self.entries.append((threshold, operator, node_index))
+        self._built = None
+
+    def _build(self):
+        thresholds = sorted({threshold for threshold, _, _ in self.entries})
+        by_operator = {operator: [] for operator in FLIPPED}
+        for threshold, operator, node_index in self.entries:
+            by_operator[operator].append((bisect_left(thresholds, threshold), node_index))
+
+        built_operators = {}
+        for operator, ranked in by_operator.items():
+            ranked.sort()
+            built_operators[operator] = ([rank for rank, _ in ranked], [node_index for _, node_index in ranked])
+        self._built = thresholds, built_operators
+        return self._built
+
+    def apply(self, value, results):
+        thresholds, by_operator = self._built or self._build()
+        lo = bisect_left(thresholds, value)
+        hi = bisect_right(thresholds, value)
+
+        ranks, nodes = by_operator['>']
+        true_nodes = nodes[:bisect_left(ranks, lo)]
+        ranks, nodes = by_operator['>=']
+        true_nodes += nodes[:bisect_left(ranks, hi)]
+        ranks, nodes = by_operator['<']
+        true_nodes += nodes[bisect_left(ranks, hi):]
+        ranks, nodes = by_operator['<=']
+        true_nodes += nodes[bisect_left(ranks, lo):]
+        ranks, nodes = by_operator['=']
+        true_nodes += nodes[bisect_left(ranks, lo):bisect_left(ranks, hi)]
+
+        for node_index in true_nodes:
+            results[node_index] = True
+
+
+# All stored rules compiled into one shared network in the style of Rete:
+# structurally identical comparisons and sub-expressions become a single
+# node, so matching a record evaluates each distinct predicate once no
+# matter how many rules contain it. Numeric predicates of the form
+# `attribute <op> number` are not evaluated one by one but decided per
+# attribute through a ThresholdIndex. Nodes are only ever appended and a
+# node's children always precede it, so evaluating the logical nodes in
+# index order after all comparisons is a valid topological order.
+class RuleNetwork:
+
+    def __init__(self):
+        self.loaded = False
+        # rules_version the network was last synced at and the ids of the
+        # rules it holds, so every server process can pick up rules that
+        # other processes created, in whatever order they committed
+        self.version = None
+        self.rule_ids = set()
+        self._reset()
+        self._lock = Lock()
+
+    def _reset(self):
+        self._nodes = []
+        self._keys = {}
+        self._rules = {}
+        self._comparisons = []
+        self._logical = []
+        self._constants = []
+        self._indexes = {}
+        self._literals = set()
+        # Every operand token, i.e. every name a record may bind
+        self._tokens = set()
+
+    def load(self, rules):
+        # rules: iterable of (rule_id, rule_name, ast) triples
+        with self._lock:
+            self._reset()
+            self.rule_ids = set()
+            for rule_id, rule_name, root in rules:
+                self._rules[rule_name] = self._intern(root)
+                self.rule_ids.add(rule_id)
+            self.loaded = True
+
+    def add_rule(self, rule_id, rule_name, root):
+        with self._lock:
+            self._rules[rule_name] = self._intern(root)
+            self.rule_ids.add(rule_id)
+
+    def _add(self, key):
+        index = self._keys.get(key)
+        if index is not None:
+            return index
+
+        index = len(self._nodes)
+        self._nodes.append(key)
+        self._keys[key] = index
+        if key[0] == COMPARISON:
+            self._add_comparison(index, *key[1:])
+        elif key[0] in (AND, OR):
+            self._logical.append(index)
+        elif key[0] == TRUE:
+            self._constants.append(index)
+        return index
+
+    def _add_comparison(self, index, operator, left, right):
+        self._tokens.update((left, right))
+        left_number, right_number = to_number(left), to_number(right)
+        if operator in FLIPPED and left_number is None and right_number is not None:
+            attribute, threshold, literal = left, right_number, right
+        elif operator in FLIPPED and left_number is not None and right_number is None:
+            attribute, threshold, literal, operator = right, left_number, left, FLIPPED[operator]
+        else:
+            self._comparisons.append(index)
+            return
+
+        self._indexes.setdefault(attribute, ThresholdIndex()).add(threshold, operator, index)
+        self._literals.add(literal)
+
+    def _intern(self, root):
+        # Post-order with an explicit stack, so deep rules intern without
+        # recursion; interned children wait on `interned` for their parent
+        interned = []
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if not node:
+                interned.append(self._add((FALSE,)))
+            elif node['elem_type'] == ElemType['COMPARISON']:
+                interned.append(self._add((COMPARISON, node['value'], node['left']['value'], node['right']['value'])))
+            elif node['elem_type'] == ElemType['LOGICAL'] and node['value'].lower() in (AND, OR):
+                if not expanded:
+                    stack.extend(((node, True), (node['right'], False), (node['left'], False)))
+                    continue
+                right = interned.pop()
+                left = interned.pop()
+                # AND/OR are commutative, so order children to share more nodes
+                interned.append(self._add((node['value'].lower(), min(left, right), max(left, right))))
+            else:
+                interned.append(self._add((TRUE,)))
+        return interned[0]
+
+    def _compare(self, node, bound):
+        _, operator, left, right = node
+        return compare_bound(operator, left, right, bound)
+
+    def match(self, conditions, schema=None):
+        # The record is typed once, as the VM types it for /eval: with a
+        # schema only declared names are attributes, and a value that does
+        # not fit its declared type raises ValueError
+        with self._lock:
+            nodes = self._nodes
+            results = [False] * len(nodes)
+            bound = bind_attributes(conditions, self._tokens.intersection(conditions), schema)
+
+            # A record that uses a numeric literal as a key would change what
+            # that literal means, so the indexes only apply when it does not
+            use_indexes = self._literals.isdisjoint(bound)
+            for attribute, index in self._indexes.items():
+                number = bound[attribute][0] if use_indexes and attribute in bound else None
+                value = number if number is not None and math.isfinite(number) else None
+                if value is not None:
+                    index.apply(value, results)
+                else:
+                    for _, _, node_index in index.entries:
+                        results[node_index] = self._compare(nodes[node_index], bound)
+
+            for node_index in self._comparisons:
+                results[node_index] = self._compare(nodes[node_index], bound)
+            for node_index in self._constants:
+                results[node_index] = True
+            for node_index in self._logical:
+                kind, left, right = nodes[node_index]
+                if kind == AND:
+                    results[node_index] = results[left] and results[right]
+                else:
+                    results[node_index] = results[left] or results[right]
+
+            return [rule_name for rule_name, index in self._rules.items() if results[index]]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rules': len(self._rules),
+                'nodes': len(self._nodes),
+                'comparisons': len(self._comparisons) + sum(len(index.entries) for index in self._indexes.values()),
+                'indexed_comparisons': sum(len(index.entries) for index in self._indexes.values()),
+                'indexed_attributes': len(self._indexes),
+            }
@@ -0,0 +1,271 @@
+import math
+from collections import namedtuple
+from App.Api.wrapper.coercion import to_float, compare_typed, coerce_value
+
+LOGICAL_OPERATORS = ('and', 'or')
+RANGE_OPERATORS = ('>', '>=', '<', '<=', '=')
+
+# Postfix stored for rules that always evaluate to True / False: a single
+# comparison between two numeric constants
+ALWAYS_TRUE = ['1', '1', '=']
+ALWAYS_FALSE = ['0', '1', '=']
+
+# nodes_before/nodes_after count tree nodes (= postfix tokens); constant is
+# True or False for a rule that always evaluates to that value, else None
+OptimizationReport = namedtuple('OptimizationReport', ['nodes_before', 'nodes_after', 'constant'])
+
+
+# An AND/OR node with all of its same-operator descendants flattened into
+# one list of operands. Comparisons are ('cmp', operator, left, right)
+# tuples and simplified groups (operator, operands) tuples, so equal
+# predicates hash and compare equal.
+class _Group:
+
+    def __init__(self, operator, operands):
+        self.operator = operator
+        self.operands = operands
+
+
+def _is_number(token):
+    return to_float(token) is not None
+
+
+def _flatten(postfix_expr):
+    stack = []
+    for token in postfix_expr:
+        if token in LOGICAL_OPERATORS:
+            right = stack.pop()
+            left = stack.pop()
+            operands = []
+            for operand in (left, right):
+                if isinstance(operand, _Group) and operand.operator == token:
+                    operands.extend(operand.operands)
+                else:
+                    operands.append(operand)
+            stack.append(_Group(token, operands))
+        elif token in RANGE_OPERATORS:
+            right = stack.pop()
+            left = stack.pop()
+            stack.append(('cmp', token, left, right))
+        else:
+            stack.append(token)
+    return stack[0] if len(stack) == 1 else None
+
+
+def _fold_comparison(comparison):
+    # Only numeric tokens are treated as constants; any other token may be
+    # an attribute, whose value is unknown until evaluation
+    _, operator, left, right = comparison
+    if _is_number(left) and _is_number(right):
+        return compare_typed(operator, coerce_value(left), coerce_value(right))
+    return comparison
+
+
+def _range_predicate(operand):
+    # (attribute, operator, literal) for `attribute <op> <number>`
+    if isinstance(operand, tuple) and operand[0] == 'cmp':
+        _, operator, left, right = operand
+        if isinstance(left, str) and isinstance(right, str) and not _is_number(left) and _is_number(right):
+            return left, operator, right
+    return None
+
+
+def _holds(operator, left, right):
+    if operator == '>':
+        return left > right
+    if operator == '>=':
+        return left >= right
+    if operator == '<':
+        return left < right
+    if operator == '<=':
+        return left <= right
+    return left == right
+
+
+def _implies_in(first, second, convert):
+    # Whether `x <first> ⇒ x <second>` for every x of a totally ordered
+    # domain whose constants are produced by convert
+    first_operator, first_value = first[0], convert(first[1])
+    second_operator, second_value = second[0], convert(second[1])
+    if first_operator == '=':
+        return _holds(second_operator, first_value, second_value)
+    if first_operator in ('>', '>=') and second_operator in ('>', '>='):
+        if second_operator == '>' and first_operator == '>=':
+            return first_value > second_value
+        return first_value >= second_value
+    if first_operator in ('<', '<=') and second_operator in ('<', '<='):
+        if second_operator == '<' and first_operator == '<=':
+            return first_value < second_value
+        return first_value <= second_value
+    return False
+
+
+def _implies(first, second):
+    # An attribute value is compared as a number when it is numeric and as
+    # a lowercase string otherwise (a missing attribute compares its own
+    # name); anything else makes every comparison False. An implication is
+    # only used when it holds for numbers and for strings alike.
+    return _implies_in(first, second, float) and _implies_in(first, second, str)
+
+
+def _satisfiable_in(predicates, convert):
+    values = [(operator, convert(literal)) for operator, literal in predicates]
+    if any(isinstance(value, float) and math.isnan(value) for _, value in values):
+        return False
+    equal = {value for operator, value in values if operator == '='}
+    if len(equal) > 1:
+        return False
+    if equal:
+        candidate = equal.pop()
+        return all(_holds(operator, candidate, value) for operator, value in values)
+
+    lower = upper = None
+    for operator, value in values:
+        if operator in ('>', '>='):
+            strict = operator == '>'
+            if lower is None or value > lower[0] or (value == lower[0] and strict):
+                lower = (value, strict)
+        else:
+            strict = operator == '<'
+            if upper is None or value < upper[0] or (value == upper[0] and strict):
+                upper = (value, strict)
+    if lower and upper:
+        if lower[0] > upper[0]:
+            return False
+        if lower[0] == upper[0] and (lower[1] or upper[1]):
+            return False
+    return True
+
+
+def _merge_ranges(operator, operands):
+    # AND drops predicates implied by another one and detects contradictory
+    # ranges; OR drops predicates that imply another one. Returns the new
+    # operands, or False for a contradictory AND.
+    by_attribute = {}
+    for operand in operands:
+        predicate = _range_predicate(operand)
+        if predicate:
+            by_attribute.setdefault(predicate[0], []).append((predicate[1], predicate[2]))
+
+    removed = set()
+    for attribute, predicates in by_attribute.items():
+        if len(predicates) < 2:
+            continue
+        # Contradictory only when no number and no string satisfies them all
+        if operator == 'and' and not _satisfiable_in(predicates, float) and not _satisfiable_in(predicates, str):
+            return False
+
+        kept = []
+        for predicate in predicates:
+            if operator == 'and':
+                redundant = any(_implies(other, predicate) for other in kept)
+                superseded = [other for other in kept if _implies(predicate, other)]
+            else:
+                redundant = any(_implies(predicate, other) for other in kept)
+                superseded = [other for other in kept if _implies(other, predicate)]
+            if redundant:
+                removed.add(('cmp', predicate[0], attribute, predicate[1]))
+                continue
+            for other in superseded:
+                kept.remove(other)
+                removed.add(('cmp', other[0], attribute, other[1]))
+            kept.append(predicate)
+
+    return [operand for operand in operands if operand not in removed]
+
+
+def _simplify_group(operator, operands):
+    flattened = []
+    for operand in operands:
+        # A simplified child may have collapsed into a group of this operator
+        if isinstance(operand, tuple) and operand[0] == operator:
+            flattened.extend(operand[1])
+        else:
+            flattened.append(operand)
+
+    # Constants: AND drops True and is False with any False operand; OR the reverse
+    absorbing = operator == 'or'
+    if any(operand is absorbing for operand in flattened):
+        return absorbing
+    operands = [operand for operand in flattened if not isinstance(operand, bool)]
+
+    # Duplicate predicates, keeping the first occurrence
+    operands = list(dict.fromkeys(operands))
+
+    operands = _merge_ranges(operator, operands)
+    if operands is False:
+        return False
+
+    if not operands:
+        return not absorbing
+    if len(operands) == 1:
+        return operands[0]
+    return (operator, tuple(operands))
+
+
+def _simplify(root):
+    # Post-order over the flattened tree with an explicit stack
+    results = []
+    stack = [(root, False)]
+    while stack:
+        node, ready = stack.pop()
+        if isinstance(node, tuple):
+            results.append(_fold_comparison(node))
+        elif isinstance(node, _Group) and not ready:
+            stack.append((node, True))
+            stack.extend((operand, False) for operand in reversed(node.operands))
+        elif isinstance(node, _Group):
+            count = len(node.operands)
+            operands = results[-count:]
+            del results[-count:]
+            results.append(_simplify_group(node.operator, operands))
+        else:
+            results.append(node)
+    return results[0]
+
+
+def _emit(node):
+    # Postfix of a simplified tree; each group's operands are paired into a
+    # balanced binary tree, as combine() does for combined rules
+    postfix = []
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            postfix.append(item)
+        elif item[0] == 'cmp':
+            _, operator, left, right = item
+            postfix.extend((left, right, operator))
+        elif item[0] == 'pair':
+            _, operator, left, right = item
+            stack.extend((operator, right, left))
+        else:
+            operator, operands = item
+            operands = list(operands)
+            while len(operands) > 1:
+                paired = [('pair', operator, left, right) for left, right in zip(operands[::2], operands[1::2])]
+                if len(operands) % 2:
+                    paired.append(operands[-1])
+                operands = paired
+            stack.append(operands[0])
+    return postfix
+
+
+def optimize_postfix(postfix_expr):
+    # Returns (postfix, OptimizationReport). The original postfix is kept
+    # unless the optimized tree is smaller.
+    postfix_expr = list(postfix_expr)
+    nodes_before = len(postfix_expr)
+    root = _flatten(postfix_expr)
+    if root is None:
+        return postfix_expr, OptimizationReport(nodes_before, nodes_before, None)
+
+    simplified = _simplify(root)
+    if isinstance(simplified, bool):
+        optimized = list(ALWAYS_TRUE if simplified else ALWAYS_FALSE)
+        return optimized, OptimizationReport(nodes_before, len(optimized), simplified)
+
+    optimized = _emit(simplified)
+    if len(optimized) >= nodes_before:
+        return postfix_expr, OptimizationReport(nodes_before, nodes_before, None)
+    return optimized, OptimizationReport(nodes_before, len(optimized), None)
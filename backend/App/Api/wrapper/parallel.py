@@ -0,0 +1,209 @@
+import multiprocessing
+import os
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+import numpy as np
+from App.Api.wrapper.codegen import compile_function
+from App.Api.wrapper.coercion import MISSING
+from App.Api.wrapper.vm import evaluate_compiled
+from App.Api.wrapper.vectorized import evaluate_ast_batch
+
+# 'rows' evaluates every record with the compiled program or function, as
+# /eval does; 'vectorized' evaluates whole columns with evaluate_ast_batch
+ROWS = 'rows'
+VECTORIZED = 'vectorized'
+
+# Rules and attribute schema of the current worker process, set once by
+# the RulePool initializer. Chunks refer to the rules by rule id.
+_worker_rules = ()
+_worker_rules_by_id = {}
+_worker_schema = None
+
+
+def worker_count(configured, processes=1):
+    # 0 means the CPUs shared evenly by `processes` processes that each run
+    # a pool, so a host never runs more pool workers than it has CPUs
+    if configured and configured > 0:
+        return configured
+    return max(1, (os.cpu_count() or 1) // max(1, processes))
+
+
+def pool_context():
+    # Workers are started by a fork server (spawned where there is none),
+    # never forked from a threaded request handler whose locks they would
+    # copy. The fork server imports this module once, so a new worker is
+    # forked with it loaded instead of importing the app again.
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+def pack_column(values):
+    # Numeric columns travel as a flat array of doubles, which pickles as one
+    # bytes buffer instead of a list of Python objects
+    try:
+        return array('d', values)
+    except (TypeError, OverflowError):
+        return list(values)
+
+
+def chunk_columns(columns, size, chunk_size):
+    # Splits columns into (columns, size) chunks of at most chunk_size rows
+    for start in range(0, size, chunk_size):
+        stop = min(start + chunk_size, size)
+        yield {token: pack_column(column[start:stop]) for token, column in columns.items()}, stop - start
+
+
+def _prepare_rule(rule, schema, backend):
+    # Compiled programs and ASTs are picklable; generated functions are not,
+    # so workers regenerate them from the AST
+    if backend == 'python':
+        return rule._replace(function=compile_function(rule.ast, schema, rule.rule_name))
+    return rule
+
+
+def _init_worker(rules, schema, backend):
+    global _worker_rules, _worker_rules_by_id, _worker_schema
+    _worker_rules = tuple(_prepare_rule(rule, schema, backend) for rule in rules)
+    _worker_rules_by_id = {rule.rule_id: rule for rule in _worker_rules}
+    _worker_schema = schema
+
+
+def _evaluate_rules(rules, columns, size, mode, schema=None):
+    # Results per rule, in rule order. In ROWS mode a record whose value
+    # does not fit the schema yields the error message instead of a bool;
+    # in VECTORIZED mode the chunk raises ValueError.
+    if mode == VECTORIZED:
+        columns = {token: np.asarray(column) if isinstance(column, array) else column for token, column in columns.items()}
+        return [evaluate_ast_batch(rule.ast, columns, size, schema=schema).tolist() for rule in rules]
+
+    # Attributes a record did not have are MISSING in the columns and left
+    # out again, so the record evaluates exactly as it would serially
+    names = list(columns)
+    values = [columns[name] for name in names]
+    records = [
+        {name: value for name, value in zip(names, row) if value is not MISSING}
+        for row in zip(*values)
+    ] if names else [{} for _ in range(size)]
+
+    results = []
+    for rule in rules:
+        rule_results = []
+        for record in records:
+            try:
+                rule_results.append(evaluate_compiled(rule, record))
+            except ValueError as e:
+                rule_results.append(str(e))
+        results.append(rule_results)
+    return results
+
+
+def _evaluate_chunk(rule_ids, columns, size, mode):
+    # rule_ids selects bound rules, in result order; None evaluates them all
+    rules = _worker_rules if rule_ids is None else [_worker_rules_by_id[rule_id] for rule_id in rule_ids]
+    return _evaluate_rules(rules, columns, size, mode, _worker_schema)
+
+
+def _bounded_map(executor, workers, submit, chunks):
+    # Yields the results of every (columns, size) chunk in input order.
+    # At most two chunks per worker are in flight, so a lazily read input
+    # is never loaded into memory as a whole.
+    pending = deque()
+    for columns, size in chunks:
+        pending.append(submit(columns, size))
+        if len(pending) >= 2 * workers:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class RulePool:
+    # A process pool bound to a fixed set of compiled rules. The rules are
+    # sent to each worker once, through the initializer; afterwards only
+    # column chunks go out and result lists come back.
+
+    def __init__(self, rules, schema=None, backend='vm', workers=0):
+        # Generated functions are rebuilt by the workers, never pickled
+        rules = [rule._replace(function=None) for rule in rules]
+        self.workers = worker_count(workers)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=pool_context(),
+            initializer=_init_worker,
+            initargs=(rules, schema, backend)
+        )
+
+    def map(self, chunks, mode=ROWS, rule_ids=None):
+        return _bounded_map(
+            self.executor, self.workers,
+            lambda columns, size: self.executor.submit(_evaluate_chunk, rule_ids, columns, size, mode),
+            chunks
+        )
+
+    def close(self, wait=True):
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# The process pool of a server process for /eval/batch. It is a RulePool,
+# so its workers receive the compiled rules once, through the initializer,
+# and chunks only carry rule ids. The pool is kept while batches ask for
+# rules it holds, under the same rules_version, schema and backend; any
+# other batch binds a new pool, and the old one is shut down once the
+# batches still using it are done.
+class SharedRulePool:
+
+    def __init__(self):
+        self._pool = None
+        self._key = None
+        self._rule_ids = frozenset()
+        # Batches currently reading from each live pool
+        self._users = {}
+        self._lock = Lock()
+
+    def _acquire(self, rules, schema, backend, version, workers):
+        key = (version, tuple(sorted((schema or {}).items())), backend, worker_count(workers))
+        rule_ids = [rule.rule_id for rule in rules]
+        with self._lock:
+            if self._pool is None or key != self._key or not self._rule_ids.issuperset(rule_ids):
+                retired, self._pool = self._pool, RulePool(rules, schema, backend, workers)
+                self._key = key
+                self._rule_ids = frozenset(rule_ids)
+                self._users[self._pool] = 0
+                if retired is not None and not self._users[retired]:
+                    del self._users[retired]
+                    retired.close(wait=False)
+            self._users[self._pool] += 1
+            return self._pool, rule_ids
+
+    def _release(self, pool):
+        with self._lock:
+            self._users[pool] -= 1
+            if pool is not self._pool and not self._users[pool]:
+                del self._users[pool]
+                pool.close(wait=False)
+
+    def map(self, rules, chunks, schema=None, backend='vm', mode=ROWS, workers=0, version=None):
+        pool, rule_ids = self._acquire(rules, schema, backend, version, workers)
+        try:
+            yield from pool.map(chunks, mode, rule_ids)
+        finally:
+            self._release(pool)
+
+    def close(self):
+        with self._lock:
+            for pool in self._users:
+                pool.close()
+            self._users.clear()
+            self._pool = None
+            self._key = None
+            self._rule_ids = frozenset()
@@ -0,0 +1,107 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+from App.Api.wrapper.constants import PRECEDENCE, ElemType
+
+# Quotes around string literals are dropped; any other character that is
+# not part of a token makes the rule invalid
+TOKEN_PATTERN = re.compile(r"(?P<token>\w+|[><]=?|\(|\)|=)|(?P<quote>['\"])|(?P<other>\S)")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+PARSE_CACHE_SIZE = 4096
+
+LOGICAL_OPERATORS = ('and', 'or')
+
+# postfix: tuple of lowercase tokens, ast: nested (elem_type, value, left,
+# right) tuples, error: None for a valid rule. Everything is immutable so
+# cached results can be shared between callers.
+ParsedRule = namedtuple('ParsedRule', ['postfix', 'ast', 'error'])
+
+
+def normalize_rule(rule):
+    # Tokens are case-insensitive and whitespace only separates them
+    return WHITESPACE_PATTERN.sub(' ', rule).strip().lower()
+
+
+def parse_rule(rule):
+    return _parse_normalized(normalize_rule(rule))
+
+
+def parse_cache_info():
+    return _parse_normalized.cache_info()
+
+
+def _apply_operator(operator, operands):
+    # Pops the operands of `operator` and pushes its node, checking that
+    # comparisons join two atoms and AND/OR join two boolean expressions
+    if len(operands) < 2:
+        return f"Missing operand for '{operator}'"
+    right = operands.pop()
+    left = operands.pop()
+
+    if operator in LOGICAL_OPERATORS:
+        if left[0] == ElemType['STRING'] or right[0] == ElemType['STRING']:
+            return f"'{operator}' must join two conditions"
+        operands.append((ElemType['LOGICAL'], operator, left, right))
+    else:
+        if left[0] != ElemType['STRING'] or right[0] != ElemType['STRING']:
+            return f"'{operator}' must compare an attribute with a value"
+        operands.append((ElemType['COMPARISON'], operator, left, right))
+    return None
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_normalized(rule):
+    # Shunting-yard over the token stream: every operator moved to the
+    # postfix output immediately becomes an AST node, so tokenizing,
+    # validation, postfix conversion and tree building share one pass
+    postfix = []
+    operators = []
+    operands = []
+    has_logical = False
+
+    def emit(operator):
+        postfix.append(operator)
+        return _apply_operator(operator, operands)
+
+    for match in TOKEN_PATTERN.finditer(rule):
+        token = match.group('token')
+        if token is None:
+            if match.group('other'):
+                return ParsedRule((), None, f"Unexpected character {match.group('other')!r} at position {match.start()}")
+            continue
+        if token not in PRECEDENCE:
+            postfix.append(token)
+            operands.append((ElemType['STRING'], token, None, None))
+        elif token == '(':
+            operators.append(token)
+        elif token == ')':
+            while operators and operators[-1] != '(':
+                error = emit(operators.pop())
+                if error:
+                    return ParsedRule((), None, error)
+            if not operators:
+                return ParsedRule((), None, "Unbalanced parentheses")
+            operators.pop()
+        else:
+            has_logical = has_logical or token in LOGICAL_OPERATORS
+            while operators and PRECEDENCE[token] <= PRECEDENCE[operators[-1]]:
+                error = emit(operators.pop())
+                if error:
+                    return ParsedRule((), None, error)
+            operators.append(token)
+
+    while operators:
+        operator = operators.pop()
+        if operator == '(':
+            return ParsedRule((), None, "Unbalanced parentheses")
+        error = emit(operator)
+        if error:
+            return ParsedRule((), None, error)
+
+    if len(operands) != 1:
+        return ParsedRule((), None, "Rule must be a single expression")
+    if operands[0][0] == ElemType['STRING'] or not has_logical:
+        return ParsedRule((), None, "Rule must contain logical and comparison operators")
+
+    return ParsedRule(tuple(postfix), operands[0], None)
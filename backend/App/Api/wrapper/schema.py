@@ -1,39 +1,227 @@
+from sqlalchemy import select, update, delete, func, or_, text
+from sqlalchemy.orm import aliased, load_only
 from App import db
 from App.Models.RuleModel import RuleModel
-from App.Models.NodeModel import NodeModel
+from App.Models.RulesVersionModel import RulesVersionModel
+from App.Models.NodeModel import NodeModel, node_digest
 
-def create_rule_schema(rule_name, rule_text, root, postfix_expr):
+def create_rule_schema(rule_name, rule_text, root, postfix_expr, ast_snapshot=None):
     existing_rule = db.session.query(RuleModel).filter_by(rule_name=rule_name).first()
     if existing_rule:
         return None, "Rule with the same name already exists."
 
-    new_rule = RuleModel(rule_name=rule_name, rule=rule_text, root=root.id, postfix_expr=postfix_expr)
+    new_rule = RuleModel(rule_name=rule_name, rule=rule_text, root=root.id, postfix_expr=postfix_expr, ast_snapshot=ast_snapshot)
     db.session.add(new_rule)
+    bump_rules_version()
     db.session.commit()
     return new_rule, None
 
-def create_node(elem_type, value, left=None, right=None):
-    node = NodeModel(elem_type=elem_type, value=value, left=left.id if left else None, right=right.id if right else None)
-    db.session.add(node)
+def create_nodes(node_specs):
+    # node_specs is a list of (elem_type, value, left_index, right_index) in
+    # postfix order. Nodes are content-addressed: a subtree whose digest is
+    # already stored, or repeated within node_specs, is reused instead of
+    # inserted again. New nodes are inserted one tree level at a time so every
+    # level is a single batched INSERT; nothing is committed here, the caller
+    # commits the nodes together with the rule row.
+    digests = []
+    for elem_type, value, left, right in node_specs:
+        digests.append(node_digest(
+            elem_type,
+            value,
+            digests[left] if left is not None else None,
+            digests[right] if right is not None else None
+        ))
+
+    nodes_by_digest = {}
+    if digests:
+        # Oldest row wins should concurrent writers have stored a digest twice.
+        # FOR KEY SHARE keeps the garbage collector from deleting a reused
+        # node before this transaction commits a reference to it.
+        existing = (
+            NodeModel.query.filter(NodeModel.digest.in_(set(digests)))
+            .order_by(NodeModel.id.desc())
+            .with_for_update(read=True, key_share=True)
+        )
+        nodes_by_digest = {node.digest: node for node in existing}
+
+    heights = {}
+    levels = {}
+    for index, (_, _, left, right) in enumerate(node_specs):
+        digest = digests[index]
+        if digest in nodes_by_digest or digest in heights:
+            continue
+        child_heights = [
+            heights[digests[child]] + 1
+            for child in (left, right)
+            if child is not None and digests[child] in heights
+        ]
+        heights[digest] = max(child_heights, default=0)
+        levels.setdefault(heights[digest], []).append(index)
+
+    for height in sorted(levels):
+        batch = []
+        for index in levels[height]:
+            elem_type, value, left, right = node_specs[index]
+            node = NodeModel(
+                elem_type=elem_type,
+                value=value,
+                left=nodes_by_digest[digests[left]].id if left is not None else None,
+                right=nodes_by_digest[digests[right]].id if right is not None else None,
+                digest=digests[index]
+            )
+            nodes_by_digest[digests[index]] = node
+            batch.append(node)
+        db.session.add_all(batch)
+        db.session.flush()
+
+    return [nodes_by_digest[digest] for digest in digests]
+
+def add_rules(rows):
+    # Stages RuleModel rows, given as dicts of column values, in the caller's
+    # transaction; one version bump covers the whole set
+    rules = [RuleModel(**row) for row in rows]
+    db.session.add_all(rules)
+    bump_rules_version()
+    db.session.flush()
+    return rules
+
+def commit():
     db.session.commit()
-    return node
 
-def save_node(elem_type, value, left=None, right=None):
-    node = NodeModel(elem_type=elem_type, value=value, left=left, right=right)
-    node.save()
-    return node
+def rollback():
+    db.session.rollback()
 
-def save_rule(rule_name, rule, root, postfix_expr):
-    new_rule = RuleModel(rule_name=rule_name, rule=rule, root=root, postfix_expr=postfix_expr)
+def save_rule(rule_name, rule, root, postfix_expr, ast_snapshot=None):
+    new_rule = RuleModel(rule_name=rule_name, rule=rule, root=root, postfix_expr=postfix_expr, ast_snapshot=ast_snapshot)
     db.session.add(new_rule)
+    bump_rules_version()
     db.session.commit()  # Commit the session
     return new_rule
 
+def bump_rules_version():
+    # Part of the caller's transaction; the row lock it takes orders
+    # concurrent rule writers
+    updated = db.session.execute(
+        update(RulesVersionModel).where(RulesVersionModel.id == 1).values(version=RulesVersionModel.version + 1)
+    ).rowcount
+    if not updated:
+        db.session.add(RulesVersionModel(id=1, version=1))
+
+def get_rules_version():
+    version = db.session.execute(select(RulesVersionModel.version).where(RulesVersionModel.id == 1)).scalar()
+    return version or 0
+
+def find_rules_page(after=None, limit=None, columns=None):
+    # Keyset pagination over the primary key: every page is an index range
+    # scan, however deep the client has paged. `columns` restricts the
+    # SELECT to the requested attributes.
+    query = RuleModel.query
+    if columns:
+        query = query.options(load_only(*columns))
+    if after is not None:
+        query = query.filter(RuleModel.id > after)
+    query = query.order_by(RuleModel.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
 def find_rule_by_name(rule_name):
     return RuleModel.query.filter_by(rule_name=rule_name).first()
 
+def find_existing_rule_names(rule_names):
+    # One set-based lookup instead of a find_rule_by_name per rule
+    rule_names = list(set(rule_names))
+    if not rule_names:
+        return set()
+    return set(db.session.execute(select(RuleModel.rule_name).where(RuleModel.rule_name.in_(rule_names))).scalars())
+
 def get_all_rules_from_db():
     return RuleModel.query.all()
 
+def find_rule_ids():
+    return set(db.session.execute(select(RuleModel.id)).scalars())
+
+def find_rules_by_ids(rule_ids):
+    rule_ids = list(rule_ids)
+    if not rule_ids:
+        return []
+    return RuleModel.query.filter(RuleModel.id.in_(rule_ids)).order_by(RuleModel.id).all()
+
 def find_node_by_id(node_id):
-    return NodeModel.query.get(node_id)
\ No newline at end of file
+    return NodeModel.query.get(node_id)
+
+def subtree_cte(roots):
+    # Walk nodes.left/nodes.right from `roots` (ids or a select of ids) with a
+    # recursive CTE. UNION visits a subtree shared by several parents once.
+    subtree = (
+        select(NodeModel.id, NodeModel.left, NodeModel.right)
+        .where(NodeModel.id.in_(roots))
+        .cte('subtree', recursive=True)
+    )
+    child = aliased(NodeModel)
+    return subtree.union(
+        select(child.id, child.left, child.right)
+        .join(subtree, child.id.in_([subtree.c.left, subtree.c.right]))
+    )
+
+def find_subtree_nodes(root_ids):
+    # A whole tree (or several) comes back in one round-trip instead of one
+    # SELECT per node
+    root_ids = list(root_ids)
+    if not root_ids:
+        return []
+
+    subtree = subtree_cte(root_ids)
+    return NodeModel.query.filter(NodeModel.id.in_(select(subtree.c.id))).all()
+
+def get_max_node_id():
+    return db.session.execute(select(func.max(NodeModel.id))).scalar() or 0
+
+def count_nodes():
+    return db.session.execute(select(func.count()).select_from(NodeModel)).scalar()
+
+def find_reachable_node_ids():
+    # Ids of every node reachable from a rule root
+    subtree = subtree_cte(select(RuleModel.root))
+    return set(db.session.execute(select(subtree.c.id)).scalars())
+
+def find_node_ids_before(before, limit):
+    # Keyset page of node ids below `before`, newest first
+    return list(db.session.execute(
+        select(NodeModel.id).where(NodeModel.id < before).order_by(NodeModel.id.desc()).limit(limit)
+    ).scalars())
+
+def delete_unreferenced_nodes(node_ids):
+    # Deletes those of node_ids that no rule and no surviving node references,
+    # in a short transaction of its own; returns how many rows were deleted.
+    # Rows a rule writer holds locked while reusing them are skipped, and a
+    # writer that looks one up after it is locked here finds it gone and
+    # inserts a fresh node.
+    locked = set(db.session.execute(
+        select(NodeModel.id).where(NodeModel.id.in_(node_ids)).with_for_update(skip_locked=True)
+    ).scalars())
+    deletable = locked - set(db.session.execute(
+        select(RuleModel.root).where(RuleModel.root.in_(locked))
+    ).scalars())
+    parents = db.session.execute(
+        select(NodeModel.id, NodeModel.left, NodeModel.right)
+        .where(or_(NodeModel.left.in_(deletable), NodeModel.right.in_(deletable)))
+    ).all() if deletable else []
+
+    # A node is kept while a parent that is not itself deleted points at it
+    while True:
+        kept = {child for parent, left, right in parents if parent not in deletable for child in (left, right)}
+        if not deletable & kept:
+            break
+        deletable -= kept
+
+    if deletable:
+        db.session.execute(delete(NodeModel).where(NodeModel.id.in_(deletable)))
+    db.session.commit()
+    return len(deletable)
+
+def nodes_table_size():
+    # Bytes used by the nodes table and its indexes, where the database reports it
+    if db.engine.dialect.name == 'postgresql':
+        return db.session.execute(text(f"SELECT pg_total_relation_size('{NodeModel.__tablename__}')")).scalar()
+    return None
@@ -0,0 +1,50 @@
+# Serialized form of a rule's AST, stored on the rule row so loading a rule
+# needs no walk over the nodes table:
+#
+#   {"v": 1, "nodes": [[node_id, elem_type, value, left, right], ...]}
+#
+# Nodes are listed children first and the root is the last entry; left and
+# right are positions in the list (or None). A subtree shared through
+# hash-consing is listed once and referenced from every parent.
+SNAPSHOT_VERSION = 1
+
+
+def encode_snapshot(node_specs, nodes, root_index, start=0):
+    # node_specs as passed to create_nodes and the nodes it returned. Specs
+    # are in postfix order, so every child is listed before its parent.
+    # When node_specs holds several trees, start is the index of the first
+    # spec of the one rooted at root_index.
+    positions = {}
+    entries = []
+    for index in range(start, root_index + 1):
+        node = nodes[index]
+        if node.id in positions:
+            continue
+        _, _, left, right = node_specs[index]
+        positions[node.id] = len(entries)
+        entries.append([
+            node.id,
+            node.elem_type,
+            node.value,
+            positions[nodes[left].id] if left is not None else None,
+            positions[nodes[right].id] if right is not None else None
+        ])
+    return {"v": SNAPSHOT_VERSION, "nodes": entries}
+
+
+def decode_snapshot(snapshot):
+    # Returns the dict tree used by the evaluators, or None when there is
+    # no snapshot or it was written in a format this code does not read
+    if not snapshot or snapshot.get("v") != SNAPSHOT_VERSION or not snapshot.get("nodes"):
+        return None
+
+    built = []
+    for node_id, elem_type, value, left, right in snapshot["nodes"]:
+        built.append({
+            'id': node_id,
+            'elem_type': elem_type,
+            'value': value,
+            'left': built[left] if left is not None else None,
+            'right': built[right] if right is not None else None
+        })
+    return built[-1]
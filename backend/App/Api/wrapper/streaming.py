@@ -0,0 +1,71 @@
+import json
+
+# NDJSON lines longer than this are reported as errors instead of buffered
+MAX_LINE_BYTES = 1024 * 1024
+
+
+def iter_ndjson(stream, max_line=MAX_LINE_BYTES):
+    # Yields (index, record, error) for every non-blank line of the stream
+    # while holding at most one line in memory
+    index = 0
+    while True:
+        line = stream.readline(max_line + 1)
+        if not line:
+            return
+        if len(line) > max_line and not line.endswith(b'\n'):
+            # Drain the rest of the oversized line in bounded reads
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(max_line + 1)
+            yield index, None, f"Record exceeds {max_line} bytes"
+            index += 1
+            continue
+        if not line.strip():
+            continue
+
+        yield (index, *parse_ndjson_line(line))
+        index += 1
+
+
+def parse_ndjson_line(line):
+    # (record, error) for one non-blank NDJSON line
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        return None, f"Invalid JSON: {e}"
+    if not isinstance(record, dict):
+        return None, "Record must be a JSON object"
+    return record, None
+
+
+def evaluate_records(records, evaluate):
+    # (index, record, error) -> one result dict per record
+    for index, record, error in records:
+        if error is None:
+            try:
+                yield {"index": index, "evaluation_result": evaluate(record)}
+                continue
+            except ValueError as e:
+                error = str(e)
+        yield {"index": index, "error": error}
+
+
+def chunk_results(results, chunk_size):
+    # Groups per-record results into lists of at most chunk_size
+    chunk = []
+    for result in results:
+        chunk.append(result)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def to_ndjson(results, chunk_size=None):
+    if not chunk_size:
+        for result in results:
+            yield json.dumps(result) + '\n'
+        return
+
+    for chunk in chunk_results(results, chunk_size):
+        yield json.dumps({"results": chunk}) + '\n'
@@ -1,99 +1,89 @@
-import re
+import hashlib
+import time
+from flask import current_app
+from App import rule_cache, result_cache, rule_network, rule_pool
+from App.metrics import timed, set_rule_name
 from App.Api.wrapper.schema import (
     create_rule_schema,
-    create_node,
-    save_node,
+    create_nodes,
+    add_rules,
+    commit,
+    rollback,
     find_rule_by_name,
+    find_existing_rule_names,
     save_rule,
     get_all_rules_from_db,
-    find_node_by_id,
+    find_rule_ids,
+    find_rules_by_ids,
+    find_rules_page,
+    get_rules_version,
+    find_subtree_nodes,
+    get_max_node_id,
+    count_nodes,
+    find_reachable_node_ids,
+    find_node_ids_before,
+    delete_unreferenced_nodes,
+    nodes_table_size,
 )
-from App.Models.NodeModel import NodeModel
-
-PRECEDENCE = {
-    '(': -1,
-    ')': -1,
-    'or': 1,
-    'and': 1,
-    '<': 2,
-    '>': 2,
-    '=': 2,
-    '<=': 2,
-    '>=': 2,
-}
-
-ElemType = {
-    'LOGICAL': 1,
-    'COMPARISON': 2,
-    'STRING': 3,
-    'INTEGER': 4,
-    'VARIABLE': 5,
-}
+from App.Api.wrapper.constants import PRECEDENCE, ElemType
+from App.Api.wrapper.adaptive import AdaptiveRegistry
+from App.Api.wrapper.parser import parse_rule
+from App.Api.wrapper.coercion import compare_values, compare_bound, bind_attributes, validate_schema
+from App.Api.wrapper.codegen import compile_function
+from App.Api.wrapper.vm import CompiledRule, compile_program, evaluate_compiled, referenced_attributes, result_key
+from App.Api.wrapper.streaming import iter_ndjson, evaluate_records, to_ndjson
+from App.Api.wrapper.vectorized import collect_tokens, records_to_columns, evaluate_ast_batch
+from App.Api.wrapper.optimizer import optimize_postfix
+from App.Api.wrapper.snapshot import encode_snapshot, decode_snapshot
+from App.Api.wrapper.parallel import RulePool, ROWS, VECTORIZED, chunk_columns, worker_count
+from App.Models.RuleModel import RuleModel
+
+adaptive_evaluators = AdaptiveRegistry()
+
+MAX_RULES_PAGE_SIZE = 1000
+RULE_NAME_MAX_LENGTH = 255
 
 def validate_rule(rule):
-    rule_pattern = r"\w+\s*(<|>|=|<=|>=)\s*('[^']*'|\w+)\s*(AND|OR)\s*\w+\s*(<|>|=|<=|>=)\s*('[^']*'|\w+)"
-    return bool(re.search(rule_pattern, rule, re.IGNORECASE))
+    return parse_rule(rule).error is None
 
 def parse_rule_to_postfix(rule):
-    tokens = re.findall(r"\w+|[><]=?|AND|OR|\(|\)|=", rule)
-    stack = []
-    postfix_expr = []
+    parsed = parse_rule(rule)
+    return list(parsed.postfix) if not parsed.error else []
 
-    for token in tokens:
-        token = token.lower()
-        if token not in PRECEDENCE:
-            postfix_expr.append(token)
-        else:
-            if not stack:
-                stack.append(token)
-            else:
-                prevoper = PRECEDENCE[stack[-1]]
-                curroper = PRECEDENCE[token]
-                if curroper > prevoper:
-                    stack.append(token)
-                else:
-                    if token == '(':
-                        stack.append(token)
-                    elif token == ')':
-                        while stack[-1] != '(':
-                            postfix_expr.append(stack.pop())
-                        stack.pop()  # remove the '('
-                    else:
-                        while stack and curroper <= PRECEDENCE[stack[-1]]:
-                            postfix_expr.append(stack.pop())
-                        stack.append(token)
-
-    while stack:
-        popped = stack.pop()
-        if PRECEDENCE.get(popped, 0) == -1:
-            return []
-        postfix_expr.append(popped)
-
-    return postfix_expr
-
-def create_ast(postfix_expr):
+def add_node_specs(postfix_expr, node_specs):
+    # Append the nodes of one postfix expression to node_specs and return the
+    # index of its root
     node_stack = []
     for token in postfix_expr:
         if token not in PRECEDENCE:
-            node = create_node(ElemType['STRING'], token)
-            node_stack.append(node)
+            node_specs.append((ElemType['STRING'], token, None, None))
         else:
             operand1 = node_stack.pop()
             operand2 = node_stack.pop()
-            node = create_node(
+            node_specs.append((
                 ElemType['LOGICAL'] if token in ['and', 'or'] else ElemType['COMPARISON'],
                 token,
                 operand2,
                 operand1
-            )
-            node_stack.append(node)
+            ))
+        node_stack.append(len(node_specs) - 1)
 
     return node_stack[0] if node_stack else None
 
+def create_ast(postfix_expr):
+    node_specs = []
+    root_index = add_node_specs(postfix_expr, node_specs)
+    if root_index is None:
+        return None, None
+
+    nodes = create_nodes(node_specs)
+    return nodes[root_index], encode_snapshot(node_specs, nodes, root_index)
+
 def create_rule(data):
     try:
         rule_name = data.get('rule_name')
         rule = data.get('rule')
+        set_rule_name(rule_name)
 
         # Validate input
         if not rule_name or len(rule_name) <= 0:
@@ -102,22 +92,33 @@ def create_rule(data):
         if not rule or not isinstance(rule, str):
             return {"status": "error", "message": "rule can't be null"}, 400
 
-        # Validate the rule format
-        if not validate_rule(rule):
-            return {"status": "error", "message": "Invalid rule format. Ensure it contains logical and comparison operators."}, 400
+        # Validate the rule format; the parse is cached, so this also yields the postfix
+        with timed('parse'):
+            parsed = parse_rule(rule)
+        if parsed.error:
+            return {"status": "error", "message": "Invalid rule format. Ensure it contains logical and comparison operators.", "details": parsed.error}, 400
 
-        # Convert the rule into postfix
-        postfix_expr = parse_rule_to_postfix(rule)
+        # Reject duplicates before any node is written
+        with timed('db'):
+            existing_rule = find_rule_by_name(rule_name)
+        if existing_rule:
+            return {"status": "error", "message": "Rule with the same name already exists."}, 400
+
+        # Convert the rule into postfix and simplify it
+        postfix_expr, optimization = optimize_rule(parsed.postfix)
 
-        # Create AST
-        root = create_ast(postfix_expr)
-        if not root:
-            return {"status": "error", "message": "Failed to create AST"}, 500
+        # Create AST and save the rule to DB in a single transaction
+        with timed('db'):
+            root, ast_snapshot = create_ast(postfix_expr)
+            if not root:
+                rollback()
+                return {"status": "error", "message": "Failed to create AST"}, 500
 
-        # Save rule to DB
-        new_rule, error = create_rule_schema(rule_name, rule, root, postfix_expr)
+            new_rule, error = create_rule_schema(rule_name, rule, root, postfix_expr, ast_snapshot)
         if error:
+            rollback()
             return {"status": "error", "message": error}, 400
+        rule_written(new_rule)
 
         return {
             "status": "success",
@@ -127,38 +128,55 @@ def create_rule(data):
                 "rule":new_rule.rule,
                 "root":new_rule.root,
                 "postfixExpr": new_rule.postfix_expr
-            }
+            },
+            "optimization": optimization
         }, 201
 
     except Exception as e:
+        rollback()
         return {"status": "error", "message": str(e)}, 500
 
-def combine(rules):
-    combined_ast = None
-    for rule in rules:
-        # Convert the rule into postfix notation
-        postfix_expr = parse_rule_to_postfix(rule)
-        root = create_ast(postfix_expr)
-
-        # If this is the first rule, set it as the combined AST
-        if not combined_ast:
-            combined_ast = root
-        else:
-            # Create a new node representing the logical combination (AND)
-            combined_node = save_node(
-                ElemType['LOGICAL'], 
-                'and', 
-                left=combined_ast.id,  # Use the ID of the combined_ast
-                right=root.id          # Use the ID of the new root
-            )
-            combined_ast = combined_node  # Update combined_ast to the new combined node
-
-    return combined_ast
+def rule_written(rule):
+    # Keep the in-process caches in step with a committed rule write. The
+    # write itself has succeeded, so a network that cannot take the rule is
+    # dropped and rebuilt by the next /match instead of failing the request.
+    rule_cache.invalidate()
+    if rule_network.loaded:
+        try:
+            rule_network.add_rule(rule.id, rule.rule_name, rule_ast(rule))
+        except Exception as e:
+            rule_network.loaded = False
+            current_app.logger.error(f"Could not add rule '{rule.rule_name}' to the rule network, it will be reloaded: {e}")
+
+def combine(postfix_exprs):
+    # AND the rules together as a balanced tree, pairing neighbours level by
+    # level, so a combined rule's depth grows with log2 of the number of
+    # rules instead of linearly. Returns the postfix of that tree.
+    parts = [list(postfix_expr) for postfix_expr in postfix_exprs]
+    if not parts:
+        return []
+
+    while len(parts) > 1:
+        paired = [left + right + ['and'] for left, right in zip(parts[::2], parts[1::2])]
+        if len(parts) % 2:
+            paired.append(parts[-1])
+        parts = paired
+    return parts[0]
+
+def optimize_rule(postfix_expr):
+    # Optimizer pass between parsing and persistence; returns the postfix to
+    # store and the report returned to the client (None when disabled)
+    if not current_app.config.get('RULE_OPTIMIZE'):
+        return list(postfix_expr), None
+    with timed('optimize'):
+        optimized, report = optimize_postfix(postfix_expr)
+    return optimized, report._asdict()
 
 def combine_rules(data):
     try:
         rule_name = data.get('rule_name')
         rules = data.get('rules')
+        set_rule_name(rule_name)
 
         # Validate input
         if not rule_name or len(rule_name) == 0:
@@ -167,28 +185,29 @@ def combine_rules(data):
             return {"status": "error", "message": "rules must be a non-empty array"}, 400
 
         # Check if a rule with the same name exists
-        existing_rule = find_rule_by_name(rule_name)
+        with timed('db'):
+            existing_rule = find_rule_by_name(rule_name)
         if existing_rule:
             return {"status": "error", "message": "A rule with this name already exists"}, 400
 
         # Validate each rule and collect postfix expressions
-        postfix_expressions = []
+        postfix_exprs = []
         for rule in rules:
-            if not validate_rule(rule):
+            with timed('parse'):
+                parsed = parse_rule(rule) if isinstance(rule, str) else None
+            if not parsed or parsed.error:
                 return {"status": "error", "message": f"Invalid rule format: {rule}"}, 400
-            
-            # Get the postfix expression for the current rule
-            postfix_expr = parse_rule_to_postfix(rule)
-            # Join the postfix expression into a string for saving
-            postfix_expressions.append(" ".join(postfix_expr))
-
-        # Combine rules into AST
-        combined_ast = combine(rules)
+            postfix_exprs.append(parsed.postfix)
+
+        # Combine rules into one tree, simplify it and persist its AST
+        combined_postfix_expr, optimization = optimize_rule(combine(postfix_exprs))
+        with timed('db'):
+            combined_ast, ast_snapshot = create_ast(combined_postfix_expr)
         if combined_ast:
             combined_rule_str = " AND ".join(rules)
-            # Create the combined postfix expression as a string
-            combined_postfix_expr = " AND ".join(postfix_expressions)
-            new_rule = save_rule(rule_name, combined_rule_str, combined_ast.id, combined_postfix_expr)
+            with timed('db'):
+                new_rule = save_rule(rule_name, combined_rule_str, combined_ast.id, combined_postfix_expr, ast_snapshot)
+            rule_written(new_rule)
             return {
                 "status": "success",
                 "message": "Rules combined successfully",
@@ -197,11 +216,115 @@ def combine_rules(data):
                     "rule":new_rule.rule,
                     "root":new_rule.root,
                     "postfixExpr": new_rule.postfix_expr
-                }
+                },
+                "optimization": optimization
             }, 201
         else:
             return {"status": "error", "message": "Failed to combine rules into AST"}, 500
     except Exception as e:
+        rollback()
+        return {"status": "error", "message": str(e)}, 500
+
+def validate_import_entry(entry, names):
+    # Returns (rule_name, rule, parsed, error) for one /import entry
+    rule_name = entry.get('rule_name') if isinstance(entry, dict) else None
+    rule = entry.get('rule') if isinstance(entry, dict) else None
+    if not rule_name or not isinstance(rule_name, str):
+        return rule_name, rule, None, "rule_name can't be null or length can't be zero"
+    if len(rule_name) > RULE_NAME_MAX_LENGTH:
+        return rule_name, rule, None, f"rule_name can't be longer than {RULE_NAME_MAX_LENGTH} characters"
+    if not rule or not isinstance(rule, str):
+        return rule_name, rule, None, "rule can't be null"
+    if rule_name in names:
+        return rule_name, rule, None, "Duplicate rule_name in this import."
+    parsed = parse_rule(rule)
+    if parsed.error:
+        return rule_name, rule, None, f"Invalid rule format: {parsed.error}"
+    return rule_name, rule, parsed, None
+
+def import_rules(data, max_rules=None):
+    # Creates many rules in a single transaction. Entries are validated and
+    # parsed up front, name conflicts are found with one query and the rules
+    # are persisted in batches whose nodes are inserted together. Invalid
+    # entries are reported by index and the valid ones are still imported.
+    # max_rules defaults to RULE_IMPORT_MAX_RULES; 0 means no limit.
+    try:
+        entries = data.get('rules') if isinstance(data, dict) else data
+        if not entries or not isinstance(entries, list):
+            return {"status": "error", "message": "rules must be a non-empty array"}, 400
+        if max_rules is None:
+            max_rules = current_app.config.get('RULE_IMPORT_MAX_RULES')
+        if max_rules and len(entries) > max_rules:
+            return {"status": "error", "message": f"At most {max_rules} rules can be imported at once"}, 400
+
+        errors = []
+        pending = []
+        names = set()
+        with timed('parse'):
+            for index, entry in enumerate(entries):
+                rule_name, rule, parsed, error = validate_import_entry(entry, names)
+                if error:
+                    errors.append({"index": index, "rule_name": rule_name, "message": error})
+                    continue
+                names.add(rule_name)
+                pending.append((index, rule_name, rule, parsed.postfix))
+
+        with timed('db'):
+            existing = find_existing_rule_names(names)
+        if existing:
+            for index, rule_name, _, _ in pending:
+                if rule_name in existing:
+                    errors.append({"index": index, "rule_name": rule_name, "message": "Rule with the same name already exists."})
+            pending = [item for item in pending if item[1] not in existing]
+
+        created = []
+        nodes_before = nodes_after = 0
+        batch_size = current_app.config.get('RULE_IMPORT_BATCH_SIZE')
+        for start in range(0, len(pending), batch_size):
+            # All trees of a batch share one node_specs list, so create_nodes
+            # inserts their new nodes level by level in a few statements and
+            # subtrees repeated across rules are stored once
+            node_specs = []
+            trees = []
+            for _, rule_name, rule, postfix in pending[start:start + batch_size]:
+                postfix_expr, optimization = optimize_rule(postfix)
+                if optimization:
+                    nodes_before += optimization['nodes_before']
+                    nodes_after += optimization['nodes_after']
+                first = len(node_specs)
+                trees.append((rule_name, rule, postfix_expr, first, add_node_specs(postfix_expr, node_specs)))
+
+            with timed('db'):
+                nodes = create_nodes(node_specs)
+                created.extend(add_rules([{
+                    "rule_name": rule_name,
+                    "rule": rule,
+                    "root": nodes[root_index].id,
+                    "postfix_expr": postfix_expr,
+                    "ast_snapshot": encode_snapshot(node_specs, nodes, root_index, first)
+                } for rule_name, rule, postfix_expr, first, root_index in trees]))
+
+        if created:
+            with timed('db'):
+                commit()
+            for new_rule in created:
+                rule_written(new_rule)
+
+        errors.sort(key=lambda error: error["index"])
+        return {
+            "status": "success" if created else "error",
+            "message": f"Imported {len(created)} of {len(entries)} rules",
+            "data": {
+                "created": len(created),
+                "failed": len(errors),
+                "errors": errors,
+                "optimization": {"nodes_before": nodes_before, "nodes_after": nodes_after}
+                if current_app.config.get('RULE_OPTIMIZE') else None
+            }
+        }, 201 if created else 400
+
+    except Exception as e:
+        rollback()
         return {"status": "error", "message": str(e)}, 500
 
 
@@ -215,14 +338,146 @@ def to_dict(self):
     }
     
 
-def get_all_rules():
+def get_all_rules(args=None, if_none_match=None):
+    # Returns (body, status, headers). Without a limit every rule is listed,
+    # as before; with one, the X-Next-Cursor header carries the `after`
+    # value of the next page. The ETag changes with the rules version and
+    # the query, so an unchanged poll costs one primary-key lookup.
     try:
-        rules = get_all_rules_from_db()
+        args = args or {}
+        fields = [field for field in args.get('fields', '').split(',') if field] or list(RuleModel.FIELDS)
+        unknown = [field for field in fields if field not in RuleModel.FIELDS]
+        if unknown:
+            return {"status": "error", "message": f"Unknown fields: {', '.join(unknown)}"}, 400, {}
+
+        try:
+            after = int(args['after']) if args.get('after') else None
+            limit = int(args['limit']) if args.get('limit') else None
+        except ValueError:
+            return {"status": "error", "message": "after and limit must be integers"}, 400, {}
+        if limit is not None and not 1 <= limit <= MAX_RULES_PAGE_SIZE:
+            return {"status": "error", "message": f"limit must be between 1 and {MAX_RULES_PAGE_SIZE}"}, 400, {}
+
+        with timed('db'):
+            version = get_rules_version()
+        etag = hashlib.sha1(f"{version}|{','.join(fields)}|{after}|{limit}".encode('utf-8')).hexdigest()
+        headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+        if if_none_match and if_none_match.contains_weak(etag):
+            return None, 304, headers
+
+        columns = [getattr(RuleModel, RuleModel.FIELDS[field]) for field in fields]
+        with timed('db'):
+            rules = find_rules_page(after, limit, columns)
+        if limit is not None and len(rules) == limit:
+            headers["X-Next-Cursor"] = str(rules[-1].id)
+
         # Convert each rule to a dictionary
-        rules_list = [rule.to_dict() for rule in rules]
-        return rules_list,200
+        rules_list = [rule.to_dict(fields) for rule in rules]
+        return rules_list, 200, headers
     except Exception as e:
-        return {"status": "error", "message": str(e)}, 500
+        return {"status": "error", "message": str(e)}, 500, {}
+
+def decode_postfix(postfix_expr):
+    # Combined rules used to be stored as their postfix expressions joined
+    # with ' AND ' (e.g. 'a 1 > b 2 < and AND c 3 ='); rewrite those into the
+    # postfix of the left-deep AND chain combine() builds for them
+    if not isinstance(postfix_expr, str):
+        return list(postfix_expr)
+
+    decoded = []
+    for index, part in enumerate(postfix_expr.split(' AND ')):
+        decoded.extend(part.split())
+        if index > 0:
+            decoded.append('and')
+    return decoded
+
+def build_ast_from_postfix(postfix_expr):
+    # Same tree create_ast persists, built in memory; node ids are postfix
+    # positions, which are stable for as long as the rule exists
+    node_specs = []
+    root_index = add_node_specs(postfix_expr, node_specs)
+    if root_index is None:
+        return None
+
+    nodes = []
+    for index, (elem_type, value, left, right) in enumerate(node_specs):
+        nodes.append({
+            'id': index,
+            'elem_type': elem_type,
+            'value': value,
+            'left': nodes[left] if left is not None else None,
+            'right': nodes[right] if right is not None else None
+        })
+    return nodes[root_index]
+
+def rule_ast(rule):
+    # The snapshot stored with the rule; rules written before snapshots
+    # existed are rebuilt from their postfix instead
+    return decode_snapshot(rule.ast_snapshot) or build_ast_from_postfix(decode_postfix(rule.postfix_expr))
+
+def attribute_schema():
+    # RULE_ATTRIBUTE_SCHEMA, applied by every evaluator
+    return validate_schema(current_app.config.get('RULE_ATTRIBUTE_SCHEMA'))
+
+def compile_rule(rule):
+    postfix_expr = decode_postfix(rule.postfix_expr)
+    root_node = rule_ast(rule)
+    if not root_node:
+        return None
+    schema = attribute_schema()
+    function = None
+    if current_app.config.get('RULE_EVAL_BACKEND') == 'python':
+        function = compile_function(root_node, schema, rule.rule_name)
+    program = compile_program(root_node, schema)
+    return CompiledRule(
+        rule.rule_name, postfix_expr, program, root_node, function, rule.id, referenced_attributes(program)
+    )
+
+def load_compiled_rule(rule_name):
+    set_rule_name(rule_name)
+    # Hot rules are served from the in-process cache without touching the DB
+    compiled = rule_cache.get(rule_name)
+    if compiled is not None:
+        return compiled, None, 200
+
+    version = rule_cache.version
+
+    # Fetch the rule from the database; its AST snapshot is all that is
+    # needed, so the nodes table is not read
+    with timed('db'):
+        rule = find_rule_by_name(rule_name)
+    if not rule:
+        return None, f"Rule '{rule_name}' not found", 404
+
+    with timed('compile'):
+        compiled = compile_rule(rule)
+    if not compiled:
+        return None, "Failed to compile rule", 500
+
+    rule_cache.put(rule_name, compiled, version)
+    return compiled, None, 200
+
+def evaluate_memoized(compiled, conditions):
+    # Repeated evaluations of the same attribute values are answered from
+    # the result cache without running the rule
+    if not result_cache.enabled:
+        return evaluate_compiled(compiled, conditions)
+    key = result_key(compiled, conditions)
+    if key is None:
+        return evaluate_compiled(compiled, conditions)
+    found, result = result_cache.get(key)
+    if not found:
+        result = evaluate_compiled(compiled, conditions)
+        result_cache.put(key, result)
+    return result
+
+def get_rule_cache_stats():
+    data = rule_cache.stats()
+    data["results"] = result_cache.stats()
+    return {
+        "status": "success",
+        "data": data
+    }, 200
 
 def evaluate_rule(data):
     try:
@@ -232,19 +487,24 @@ def evaluate_rule(data):
         if not rule_name or not conditions:
             return {"status": "error", "message": "Missing rule_name or conditions in request"}, 400
 
-        # Fetch the rule from the database
-        rule = find_rule_by_name(rule_name)
-        if not rule:
-            return {"status": "error", "message": f"Rule '{rule_name}' not found"}, 404
-
-        # Reconstruct the AST
-        root_node = reconstruct_ast(rule.root)
-        if not root_node:
-            return {"status": "error", "message": "Failed to reconstruct AST"}, 500
+        compiled, error, status_code = load_compiled_rule(rule_name)
+        if error:
+            return {"status": "error", "message": error}, status_code
 
-        # Evaluate the AST
-        evaluation_result = evaluate_ast(root_node, conditions)
-        print(f'Evaluation Result: {evaluation_result}')
+        # Evaluate the compiled program
+        with timed('evaluate'):
+            try:
+                if data.get('adaptive', current_app.config.get('RULE_EVAL_ADAPTIVE')):
+                    # Attributes are typed up front, as the VM binds them
+                    bound = bind_attributes(conditions, compiled.attributes, attribute_schema())
+                    evaluator = adaptive_evaluators.get(rule_name, compiled.ast, compare_bound_node)
+                    evaluation_result = evaluator.evaluate(bound)
+                else:
+                    evaluation_result = evaluate_memoized(compiled, conditions)
+            except ValueError as e:
+                # A value that does not match RULE_ATTRIBUTE_SCHEMA
+                return {"status": "error", "message": str(e)}, 400
+        current_app.logger.debug(f'Evaluation Result: {evaluation_result}')
 
         return {
             "status": "success",
@@ -258,79 +518,363 @@ def evaluate_rule(data):
         print(f"Error evaluating Rule: {e}")
         return {"status": "error", "message": "Internal Server Error"}, 500
 
-def evaluate_ast(node, conditions):
+def compare_bound_node(node, bound):
+    return compare_bound(node['value'], node['left']['value'], node['right']['value'], bound)
+
+def evaluate_rule_stream(rule_name, stream, chunk_size=None):
+    # Returns a generator of NDJSON lines: records are read, evaluated and
+    # written one at a time, so memory does not grow with the input size
+    if not rule_name:
+        return None, {"status": "error", "message": "Missing rule_name in request"}, 400
+    if chunk_size is not None and chunk_size <= 0:
+        return None, {"status": "error", "message": "chunk_size must be a positive integer"}, 400
+
+    compiled, error, status_code = load_compiled_rule(rule_name)
+    if error:
+        return None, {"status": "error", "message": error}, status_code
+
+    results = evaluate_records(iter_ndjson(stream), lambda record: evaluate_memoized(compiled, record))
+    return to_ndjson(results, chunk_size), None, 200
+
+def get_evaluation_stats(rule_name):
+    if not rule_name:
+        return {"status": "error", "message": "Missing rule_name in request"}, 400
+
+    report = adaptive_evaluators.report(rule_name)
+    if report is None:
+        return {"status": "error", "message": f"No adaptive evaluations recorded for rule '{rule_name}'"}, 404
+
+    return {
+        "status": "success",
+        "data": {
+            "rule_name": rule_name,
+            **report
+        }
+    }, 200
+
+def evaluate_rule_batch(data):
     try:
-        if not node:
-            return False
+        rule_name = data.get('rule_name')
+        records = data.get('records')
+        columns = data.get('columns')
 
-        if node['elem_type'] == ElemType['COMPARISON']:
-            left_value = conditions.get(node['left']['value'], node['left']['value'])
-            right_value = conditions.get(node['right']['value'], node['right']['value'])
+        if not rule_name or (records is None and columns is None):
+            return {"status": "error", "message": "Missing rule_name and records or columns in request"}, 400
 
-            # Convert both values to float if possible, otherwise keep as string
+        if records is not None:
+            if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+                return {"status": "error", "message": "records must be an array of objects"}, 400
+            size = len(records)
+        else:
+            if not isinstance(columns, dict) or not all(isinstance(column, list) for column in columns.values()):
+                return {"status": "error", "message": "columns must be an object of arrays"}, 400
+            sizes = {len(column) for column in columns.values()}
+            if len(sizes) > 1:
+                return {"status": "error", "message": "All columns must have the same length"}, 400
+            size = sizes.pop() if sizes else 0
+
+        compiled, error, status_code = load_compiled_rule(rule_name)
+        if error:
+            return {"status": "error", "message": error}, status_code
+
+        with timed('evaluate'):
             try:
-                left_value = float(left_value)
-                right_value = float(right_value)
-            except ValueError:
-                # If conversion fails, keep the values as strings
-                pass
-
-            if isinstance(left_value, str) and isinstance(right_value, str):
-                left_value = left_value.lower()
-                right_value = right_value.lower()
-
-            if node['value'] == '>':
-                return left_value > right_value
-            elif node['value'] == '<':
-                return left_value < right_value
-            elif node['value'] == '=':
-                return left_value == right_value
-            elif node['value'] == '<=':
-                return left_value <= right_value
-            elif node['value'] == '>=':
-                return left_value >= right_value
-            else:
-                return False
+                if size >= current_app.config.get('RULE_EVAL_PARALLEL_THRESHOLD') and pool_workers() > 1:
+                    # Large batches are spread over a process pool
+                    tokens = collect_tokens(compiled.ast)
+                    if records is not None:
+                        columns = records_to_columns(records, tokens)
+                    else:
+                        columns = {token: column for token, column in columns.items() if token in tokens}
+                    mode = ROWS if records is not None and compiled.function else VECTORIZED
+                    evaluation_results = evaluate_in_pool([compiled], columns, size, mode)[0]
+                    errors = [result for result in evaluation_results if isinstance(result, str)]
+                    if errors:
+                        return {"status": "error", "message": errors[0]}, 400
+                elif records is not None and compiled.function:
+                    evaluation_results = [evaluate_compiled(compiled, record) for record in records]
+                else:
+                    if records is not None:
+                        columns = records_to_columns(records, collect_tokens(compiled.ast))
+                    evaluation_results = evaluate_ast_batch(compiled.ast, columns, size, schema=attribute_schema()).tolist()
+            except ValueError as e:
+                # A value that does not match RULE_ATTRIBUTE_SCHEMA
+                return {"status": "error", "message": str(e)}, 400
+
+        return {
+            "status": "success",
+            "message": "Rule evaluated successfully",
+            "data": {
+                "count": size,
+                "evaluation_results": evaluation_results
+            }
+        }, 200
 
-        if node['elem_type'] == ElemType['LOGICAL']:
-            left_eval = evaluate_ast(node['left'], conditions)
-            right_eval = evaluate_ast(node['right'], conditions)
+    except Exception as e:
+        print(f"Error evaluating Rule batch: {e}")
+        return {"status": "error", "message": "Internal Server Error"}, 500
 
-            if node['value'].lower() == 'and':
-                return left_eval and right_eval
-            elif node['value'].lower() == 'or':
-                return left_eval or right_eval
+def open_rule_pool(compiled_rules, workers=None):
+    config = current_app.config
+    return RulePool(
+        compiled_rules,
+        attribute_schema(),
+        config.get('RULE_EVAL_BACKEND'),
+        config.get('RULE_EVAL_WORKERS') if workers is None else workers
+    )
+
+def pool_workers():
+    # Every server process runs its own pool, so by default the CPUs are
+    # split between the WEB_CONCURRENCY processes
+    config = current_app.config
+    return worker_count(config.get('RULE_EVAL_WORKERS'), config.get('WEB_CONCURRENCY'))
+
+def evaluate_in_pool(compiled_rules, columns, size, mode=ROWS):
+    # Returns one result list per rule, in record order. Requests share the
+    # process-wide pool, which keeps its workers while the rules and
+    # rules_version stay the same, so no worker processes are started per
+    # request.
+    config = current_app.config
+    with timed('db'):
+        version = get_rules_version()
+    results = [[] for _ in compiled_rules]
+    chunks = chunk_columns(columns, size, config.get('RULE_EVAL_CHUNK_SIZE'))
+    for chunk_results in rule_pool.map(
+        compiled_rules,
+        chunks,
+        attribute_schema(),
+        config.get('RULE_EVAL_BACKEND'),
+        mode,
+        pool_workers(),
+        version
+    ):
+        for rule_results, chunk in zip(results, chunk_results):
+            rule_results.extend(chunk)
+    return results
+
+def load_rule_network():
+    # Compile every stored rule into the shared network from one query; the
+    # trees come from the rules' snapshots, not from the nodes table
+    # The version is read first: a rule committed after it bumps the
+    # version again and is picked up by the next refresh
+    with timed('db'):
+        version = get_rules_version()
+        rules = get_all_rules_from_db()
+    with timed('compile'):
+        rule_network.load((rule.id, rule.rule_name, rule_ast(rule)) for rule in rules)
+    rule_network.version = version
+
+def refresh_rule_network():
+    # Under a multi-process server a rule may have been created by another
+    # worker. Every rule write bumps rules_version in its own transaction,
+    # so an unchanged version means nothing to do; otherwise the stored ids
+    # are compared with the loaded ones. Ids are not handed out in commit
+    # order, so a high-water mark on rules.id could skip a slow writer.
+    with timed('db'):
+        version = get_rules_version()
+        if version == rule_network.version:
+            return
+        missing = find_rule_ids() - rule_network.rule_ids
+        rules = find_rules_by_ids(missing)
+    if rules:
+        with timed('compile'):
+            for rule in rules:
+                rule_network.add_rule(rule.id, rule.rule_name, rule_ast(rule))
+    rule_network.version = version
+
+def collect_orphan_nodes(batch_size=None, max_batches=None, before=None, dry_run=False, pause=0, progress=None):
+    # Garbage-collects nodes that no rule reaches any more. Mark: the ids
+    # reachable from every rule root, with nodes newer than the mark left
+    # alone. Sweep: the unreachable ids, newest first so parents go before
+    # their children, deleted batch_size at a time in short transactions
+    # that re-check every node under a row lock. `before` resumes a sweep
+    # stopped by max_batches; progress(report) is called after each batch.
+    batch_size = batch_size or current_app.config.get('NODE_GC_BATCH_SIZE')
+    size_before = nodes_table_size()
+    node_count = count_nodes() if size_before else 0
+    max_node_id = get_max_node_id()
+    reachable = find_reachable_node_ids()
+    # End the mark's read transaction before sweeping
+    rollback()
+
+    report = {
+        "reachable": len(reachable),
+        "scanned": 0,
+        "unreachable": 0,
+        "deleted": 0,
+        "batches": 0,
+        "resume_before": None,
+        "bytes_before": size_before,
+        "estimated_bytes_reclaimed": None,
+    }
+    cursor = min(before, max_node_id + 1) if before else max_node_id + 1
+    while True:
+        if max_batches and report["batches"] >= max_batches:
+            report["resume_before"] = cursor
+            break
+        # Page through ids until a full batch of unreachable ones is found
+        batch = []
+        while len(batch) < batch_size:
+            page = find_node_ids_before(cursor, batch_size)
+            if not page:
+                break
+            for node_id in page:
+                cursor = node_id
+                report["scanned"] += 1
+                if node_id not in reachable:
+                    batch.append(node_id)
+                    if len(batch) == batch_size:
+                        break
+        if not batch:
+            rollback()
+            break
+
+        report["unreachable"] += len(batch)
+        if not dry_run:
+            report["deleted"] += delete_unreferenced_nodes(batch)
+        else:
+            rollback()
+        report["batches"] += 1
+        if progress:
+            progress(report)
+        if pause:
+            time.sleep(pause)
+
+    if node_count:
+        # Freed rows are reused at once; the files only shrink after a VACUUM FULL
+        report["estimated_bytes_reclaimed"] = size_before * report["deleted"] // node_count
+    return report
+
+def match_rules(data):
+    try:
+        conditions = data.get('conditions')
+
+        if not conditions or not isinstance(conditions, dict):
+            return {"status": "error", "message": "Missing conditions in request"}, 400
+
+        if not rule_network.loaded:
+            load_rule_network()
+        else:
+            refresh_rule_network()
 
-        return True
+        with timed('evaluate'):
+            try:
+                matches = rule_network.match(conditions, attribute_schema())
+            except ValueError as e:
+                # A value that does not match RULE_ATTRIBUTE_SCHEMA
+                return {"status": "error", "message": str(e)}, 400
+
+        return {
+            "status": "success",
+            "message": "Rules matched successfully",
+            "data": {
+                "count": len(matches),
+                "matches": matches
+            }
+        }, 200
+
+    except Exception as e:
+        print(f"Error matching Rules: {e}")
+        return {"status": "error", "message": "Internal Server Error"}, 500
+
+def evaluate_ast(node, conditions):
+    # Explicit-stack evaluation, so deep trees never reach the recursion
+    # limit. An AND/OR node is visited twice: first to evaluate its left
+    # operand, then to either short-circuit on that result or hand over to
+    # its right operand, whose result becomes the node's own.
+    try:
+        results = []
+        stack = [(node, False)]
+        while stack:
+            current, left_done = stack.pop()
+            if not current:
+                results.append(False)
+                continue
+
+            elem_type = current['elem_type']
+            if elem_type == ElemType['COMPARISON']:
+                left_value = conditions.get(current['left']['value'], current['left']['value'])
+                right_value = conditions.get(current['right']['value'], current['right']['value'])
+
+                # Numbers compare as numbers, otherwise as lowercase strings
+                results.append(compare_values(current['value'], left_value, right_value))
+                continue
+
+            operator = current['value'].lower() if elem_type == ElemType['LOGICAL'] else None
+            if operator not in ('and', 'or'):
+                results.append(True)
+            elif not left_done:
+                stack.append((current, True))
+                stack.append((current['left'], False))
+            else:
+                # The right operand is only evaluated when it can change the result
+                if (operator == 'and') == bool(results[-1]):
+                    results.pop()
+                    stack.append((current['right'], False))
+
+        return results[-1]
     except Exception as error:
         print(f"Error evaluating AST: {error}")
         raise ValueError('Failed to evaluate AST')
 
-# You'll need to implement this function to reconstruct the AST from your database
-from App.Api.wrapper.schema import find_node_by_id
+def build_ast(node_id, nodes_by_id, built=None):
+    # Build the dict tree from already-loaded rows; `built` lets subtrees
+    # shared between several roots be materialized once. Nodes are built
+    # children first from an explicit stack, so depth is not limited by the
+    # recursion limit.
+    if built is None:
+        built = {}
 
-def reconstruct_ast(node_id):
-    try:
-        node = find_node_by_id(node_id)
-        if not node:
-            return None
+    visiting = set()
+    stack = [node_id]
+    while stack:
+        current_id = stack[-1]
+        if current_id in built:
+            stack.pop()
+            continue
 
+        node = nodes_by_id.get(current_id)
+        if not node:
+            built[current_id] = None
+            stack.pop()
+            continue
+
+        pending = [child for child in (node.left, node.right) if child and child not in built]
+        if pending:
+            if visiting.intersection(pending):
+                raise ValueError(f"Node {current_id} is part of a cycle")
+            visiting.add(current_id)
+            stack.extend(pending)
+            continue
+
+        stack.pop()
+        visiting.discard(current_id)
         # Create a dictionary representation of the node
-        reconstructed_node = {
+        built[current_id] = {
             'id': node.id,
             'elem_type': node.elem_type,
             'value': node.value,
-            'left': None,
-            'right': None
+            'left': built[node.left] if node.left else None,
+            'right': built[node.right] if node.right else None
         }
 
-        # Recursively reconstruct left and right children if they exist
-        if node.left:
-            reconstructed_node['left'] = reconstruct_ast(node.left)
-        if node.right:
-            reconstructed_node['right'] = reconstruct_ast(node.right)
+    return built[node_id]
 
-        return reconstructed_node
+def reconstruct_ast(node_id):
+    try:
+        nodes_by_id = {node.id: node for node in find_subtree_nodes([node_id])}
+        return build_ast(node_id, nodes_by_id)
     except Exception as e:
         print(f"Error reconstructing AST: {e}")
         return None
+
+def reconstruct_asts(root_ids):
+    # Load the trees of many rules with a single query, keyed by root id
+    try:
+        root_ids = set(root_ids)
+        nodes_by_id = {node.id: node for node in find_subtree_nodes(root_ids)}
+        built = {}
+        return {root_id: build_ast(root_id, nodes_by_id, built) for root_id in root_ids}
+    except Exception as e:
+        print(f"Error reconstructing ASTs: {e}")
+        return {}
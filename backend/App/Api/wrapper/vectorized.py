@@ -0,0 +1,154 @@
+import numpy as np
+from App.Api.wrapper.constants import ElemType
+from App.Api.wrapper.coercion import MISSING, coerce_value, coerce_attribute, STRING
+
+COMPARATORS = {
+    '>': np.greater,
+    '<': np.less,
+    '=': np.equal,
+    '<=': np.less_equal,
+    '>=': np.greater_equal,
+}
+
+
+def collect_tokens(node, tokens=None):
+    # Operand tokens referenced by the comparisons of a tree
+    if tokens is None:
+        tokens = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if not node:
+            continue
+        if node['elem_type'] == ElemType['COMPARISON']:
+            for operand in (node['left'], node['right']):
+                if operand:
+                    tokens.add(operand['value'])
+        else:
+            stack.extend((node['right'], node['left']))
+    return tokens
+
+
+def records_to_columns(records, tokens):
+    # Only tokens some record actually provides become columns; a record that
+    # lacks the key gets MISSING, which evaluates as the token itself (as in
+    # evaluate_ast) and is left out when the record is rebuilt from columns
+    columns = {}
+    for token in tokens:
+        if any(token in record for record in records):
+            columns[token] = [record.get(token, MISSING) for record in records]
+    return columns
+
+
+# Marks a value coerce_column has not seen yet; distinct from MISSING, which
+# is itself a cacheable column value
+_UNCACHED = object()
+
+
+def _coerce_value(value, token=None, attribute_type=None):
+    # (number, is_number, string); NaN stands in for a missing number so the
+    # numbers fit a float array, and is_number tells it from a real NaN.
+    # MISSING takes the token's own value; declared attributes are typed as
+    # the VM types them, raising ValueError for a value that does not fit.
+    if value is MISSING:
+        number, string = coerce_value(token)
+    elif attribute_type:
+        number, string = coerce_attribute(token, value, attribute_type)
+    else:
+        number, string = coerce_value(value)
+    return np.nan if number is None else number, number is not None, string
+
+
+def coerce_column(values, size, token=None, attribute_type=None):
+    # Returns (numbers, is_number, strings) arrays of length `size`. A scalar
+    # is broadcast, which is how rule literals are handled. MISSING entries
+    # of the column of `token` take the token's own value.
+    if not isinstance(values, (list, tuple, np.ndarray)):
+        number, is_number, string = _coerce_value(values)
+        return (
+            np.full(size, number),
+            np.full(size, is_number),
+            np.full(size, string, dtype=object),
+        )
+
+    # Fast path: a column of plain numbers converts in one C call
+    try:
+        array = np.asarray(values)
+    except ValueError:
+        array = None
+    if array is not None and array.dtype.kind in 'biuf' and attribute_type != STRING:
+        return array.astype(float), np.ones(size, dtype=bool), np.full(size, None, dtype=object)
+
+    numbers = np.empty(size)
+    is_number = np.empty(size, dtype=bool)
+    strings = np.empty(size, dtype=object)
+    coerced = {}
+    for index, value in enumerate(values):
+        try:
+            typed = coerced.get(value, _UNCACHED)
+        except TypeError:
+            # Unhashable values (lists, objects) are coerced every time
+            typed = _coerce_value(value, token, attribute_type)
+        else:
+            if typed is _UNCACHED:
+                typed = coerced[value] = _coerce_value(value, token, attribute_type)
+        numbers[index], is_number[index], strings[index] = typed
+    return numbers, is_number, strings
+
+
+def _compare_batch(node, columns, size, coerced, schema):
+    compare = COMPARATORS.get(node['value'])
+    if compare is None:
+        return np.zeros(size, dtype=bool)
+
+    operands = []
+    for operand in (node['left'], node['right']):
+        token = operand['value']
+        if token not in coerced:
+            if schema and token not in schema:
+                # Only declared names are attributes; anything else is a literal
+                coerced[token] = coerce_column(token, size)
+            else:
+                coerced[token] = coerce_column(columns.get(token, token), size, token, schema.get(token) if schema else None)
+        operands.append(coerced[token])
+    (left_num, left_is_num, left_str), (right_num, right_is_num, right_str) = operands
+
+    result = np.zeros(size, dtype=bool)
+    numeric = left_is_num & right_is_num
+    if numeric.any():
+        result[numeric] = compare(left_num[numeric], right_num[numeric])
+    textual = ~left_is_num & (left_str != None) & (right_str != None)  # noqa: E711
+    if textual.any():
+        result[textual] = compare(left_str[textual], right_str[textual]).astype(bool)
+    return result
+
+
+def evaluate_ast_batch(node, columns, size, coerced=None, schema=None):
+    # Column-wise counterpart of evaluate_ast: every comparison produces a
+    # boolean mask over all records and logical nodes combine the masks.
+    # As in evaluate_ast, values compare as numbers when both sides convert,
+    # and as lowercase strings when the left side does not. Any other mix
+    # yields False instead of raising. With a schema, attributes are typed
+    # as the VM types them and a value that does not fit raises ValueError.
+    # The tree is walked post-order with an explicit stack, so deep rules
+    # need no recursion.
+    if coerced is None:
+        coerced = {}
+    masks = []
+    stack = [(node, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if not node:
+            masks.append(np.zeros(size, dtype=bool))
+        elif node['elem_type'] == ElemType['COMPARISON']:
+            masks.append(_compare_batch(node, columns, size, coerced, schema))
+        elif node['elem_type'] == ElemType['LOGICAL'] and node['value'].lower() in ('and', 'or'):
+            if not expanded:
+                stack.extend(((node, True), (node['right'], False), (node['left'], False)))
+                continue
+            right = masks.pop()
+            left = masks.pop()
+            masks.append(left & right if node['value'].lower() == 'and' else left | right)
+        else:
+            masks.append(np.ones(size, dtype=bool))
+    return masks[0]
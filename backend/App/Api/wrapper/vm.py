@@ -0,0 +1,200 @@
+from array import array
+from collections import namedtuple
+from App.Api.wrapper.constants import ElemType
+from App.Api.wrapper.coercion import MISSING, coerce_value, coerce_attribute
+
+# Opcodes. Every instruction is an (opcode, a, b) triple; for comparisons
+# a and b are operand slots, for jumps b is the target instruction offset.
+CMP_GT = 0
+CMP_LT = 1
+CMP_EQ = 2
+CMP_LE = 3
+CMP_GE = 4
+LOAD_FALSE = 5
+LOAD_TRUE = 6
+JUMP_IF_FALSE_OR_POP = 7
+JUMP_IF_TRUE_OR_POP = 8
+
+COMPARISON_OPCODES = {
+    '>': CMP_GT,
+    '<': CMP_LT,
+    '=': CMP_EQ,
+    '<=': CMP_LE,
+    '>=': CMP_GE,
+}
+
+# code: flat array('l') of instruction triples. names: the token of every
+# operand slot. constants: the same tokens typed at compile time as
+# (number, lowercase string). attributes: the slots that are read from the
+# conditions, with their declared type (None when undeclared). Without a
+# schema every token may be an attribute; with one only declared names are.
+# initial: the slot values a run starts from, None for a slot that is typed
+# on first load. typed: the declared attributes, typed before the run.
+Program = namedtuple('Program', ['code', 'names', 'constants', 'attributes', 'initial', 'typed'])
+
+# A rule ready for evaluation: `program` is the /eval fast path, `ast` the
+# dict tree used by the batch and adaptive evaluators and `function` the
+# generated Python function when the 'python' backend is enabled. rule_id
+# identifies the stored rule version and attributes are the names of the
+# conditions the rule can read, so the result depends on nothing else.
+CompiledRule = namedtuple(
+    'CompiledRule', ['rule_name', 'postfix', 'program', 'ast', 'function', 'rule_id', 'attributes']
+)
+
+
+def compile_program(root, schema=None):
+    code = array('l')
+    slots = {}
+    names = []
+
+    def slot(token):
+        if token not in slots:
+            slots[token] = len(names)
+            names.append(token)
+        return slots[token]
+
+    def emit(opcode, a=0, b=0):
+        code.extend((opcode, a, b))
+        return len(code) - 3
+
+    # Explicit stack of pending steps, so deep rules compile without
+    # recursion: ('node', node), ('jump', opcode, jumps) and ('patch', jumps)
+    steps = [('node', root)]
+    while steps:
+        step = steps.pop()
+        if step[0] == 'jump':
+            step[2].append(emit(step[1]))
+        elif step[0] == 'patch':
+            code[step[1][0] + 2] = len(code)
+        else:
+            node = step[1]
+            if not node:
+                emit(LOAD_FALSE)
+            elif node['elem_type'] == ElemType['COMPARISON']:
+                opcode = COMPARISON_OPCODES.get(node['value'])
+                if opcode is None:
+                    emit(LOAD_FALSE)
+                else:
+                    emit(opcode, slot(node['left']['value']), slot(node['right']['value']))
+            elif node['elem_type'] == ElemType['LOGICAL'] and node['value'].lower() in ('and', 'or'):
+                # The stack only ever holds the latest result: a jump either
+                # keeps it as the node's value or pops it for the right
+                # operand. Steps run left operand, jump, right operand, patch.
+                opcode = JUMP_IF_FALSE_OR_POP if node['value'].lower() == 'and' else JUMP_IF_TRUE_OR_POP
+                jumps = []
+                steps.extend((('patch', jumps), ('node', node['right']), ('jump', opcode, jumps), ('node', node['left'])))
+            else:
+                emit(LOAD_TRUE)
+
+    constants = tuple(coerce_value(name) for name in names)
+    if schema:
+        attributes = tuple((slot, schema[name]) for slot, name in enumerate(names) if name in schema)
+        initial = constants
+    else:
+        # Any slot may be an attribute, so every slot is typed on first load
+        # and a short-circuited operand is never looked up
+        attributes = tuple((slot, None) for slot in range(len(names)))
+        initial = (None,) * len(names)
+    return Program(code, tuple(names), constants, attributes, initial, attributes if schema else ())
+
+
+def bind_conditions(program, conditions):
+    # Slot values to start a run from. Declared attributes are typed before
+    # the program runs, so a value that does not fit its type raises
+    # ValueError whichever operands the run reads, as in every evaluator.
+    values = list(program.initial)
+    names = program.names
+    for slot, attribute_type in program.typed:
+        name = names[slot]
+        if name in conditions:
+            values[slot] = coerce_attribute(name, conditions[name], attribute_type)
+    return values
+
+
+def load_slot(program, conditions, values, slot):
+    # Types an unbound slot on its first load: the record's value when the
+    # token is one of its attributes, else the token itself
+    name = program.names[slot]
+    value = values[slot] = coerce_value(conditions[name]) if name in conditions else program.constants[slot]
+    return value
+
+
+def run_program(program, conditions):
+    # Values compare as numbers when both sides are numbers and as lowercase
+    # strings when the left side is not (as in evaluate_ast); any other mix
+    # of types is False. Each slot is coerced at most once per run.
+    values = bind_conditions(program, conditions)
+    code = program.code
+    end = len(code)
+    pc = 0
+    top = False
+
+    while pc < end:
+        opcode = code[pc]
+        if opcode <= CMP_GE:
+            left = values[code[pc + 1]]
+            if left is None:
+                left = load_slot(program, conditions, values, code[pc + 1])
+            right = values[code[pc + 2]]
+            if right is None:
+                right = load_slot(program, conditions, values, code[pc + 2])
+            left_number, left_string = left
+            right_number, right_string = right
+
+            if left_number is not None and right_number is not None:
+                left, right = left_number, right_number
+            elif left_number is None and left_string is not None and right_string is not None:
+                left, right = left_string, right_string
+            else:
+                top = False
+                pc += 3
+                continue
+
+            if opcode == CMP_GT:
+                top = left > right
+            elif opcode == CMP_LT:
+                top = left < right
+            elif opcode == CMP_EQ:
+                top = left == right
+            elif opcode == CMP_LE:
+                top = left <= right
+            else:
+                top = left >= right
+        elif opcode == JUMP_IF_FALSE_OR_POP:
+            if not top:
+                pc = code[pc + 2]
+                continue
+        elif opcode == JUMP_IF_TRUE_OR_POP:
+            if top:
+                pc = code[pc + 2]
+                continue
+        else:
+            top = opcode == LOAD_TRUE
+        pc += 3
+
+    return top
+
+
+def referenced_attributes(program):
+    return tuple(program.names[slot] for slot, _ in program.attributes)
+
+
+def result_key(compiled, conditions):
+    # (rule_id, values of the referenced attributes): two condition sets with
+    # the same key evaluate to the same result. None when a value is not
+    # hashable and the result cannot be memoized.
+    if not isinstance(conditions, dict):
+        return None
+    values = tuple(conditions.get(name, MISSING) for name in compiled.attributes)
+    try:
+        hash(values)
+    except TypeError:
+        return None
+    return compiled.rule_id, values
+
+
+def evaluate_compiled(compiled, conditions):
+    # Generated function when the 'python' backend produced one, else the VM
+    if compiled.function:
+        return compiled.function(conditions)
+    return run_program(compiled.program, conditions)
@@ -1,5 +1,12 @@
+import hashlib
+import json
 from App import db
 
+def node_digest(elem_type, value, left_digest=None, right_digest=None):
+    # Merkle hash of a subtree: equal digests mean structurally equal trees
+    content = json.dumps([elem_type, value, left_digest, right_digest])
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
 class NodeModel(db.Model):
     __tablename__ = 'nodes'
 
@@ -8,6 +15,7 @@ class NodeModel(db.Model):
     value = db.Column(db.String(255), nullable=False)
     left = db.Column(db.Integer, db.ForeignKey('nodes.id'), nullable=True)
     right = db.Column(db.Integer, db.ForeignKey('nodes.id'), nullable=True)
+    digest = db.Column(db.String(64), nullable=True, index=True)  # Content address of the subtree rooted here
 
     def save(self):
         db.session.add(self)
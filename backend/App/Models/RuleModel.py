@@ -8,6 +8,7 @@ class RuleModel(db.Model):
     rule = db.Column(db.Text, nullable=False)
     root = db.Column(db.Integer, nullable=False)
     postfix_expr = db.Column(db.JSON, nullable=False)
+    ast_snapshot = db.Column(db.JSON, nullable=True)  # Versioned serialized AST, see App/Api/wrapper/snapshot.py
 
     @classmethod
     def find_one(cls, filters):
@@ -21,11 +22,19 @@ class RuleModel(db.Model):
         db.session.add(self)
         db.session.commit()
 
-    def to_dict(self):
-        return {
-            'id': str(self.id),
-            'rule_name': self.rule_name,
-            'rule': self.rule,
-            'root': self.root,
-            'postfixExpr': self.postfix_expr
-        }
\ No newline at end of file
+    # Serialized field name -> attribute
+    FIELDS = {
+        'id': 'id',
+        'rule_name': 'rule_name',
+        'rule': 'rule',
+        'root': 'root',
+        'postfixExpr': 'postfix_expr',
+    }
+
+    def to_dict(self, fields=None):
+        # Only the requested fields are read, so a projected query never
+        # lazy-loads the columns it skipped
+        data = {field: getattr(self, self.FIELDS[field]) for field in (fields or self.FIELDS)}
+        if 'id' in data:
+            data['id'] = str(data['id'])
+        return data
\ No newline at end of file
@@ -0,0 +1,10 @@
+from App import db
+
+class RulesVersionModel(db.Model):
+    __tablename__ = 'rules_version'
+
+    # A single row whose version is bumped in the same transaction as every
+    # write to the rules table, so readers can tell the table has not changed
+    # without scanning it
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
\ No newline at end of file
@@ -5,11 +5,20 @@ from App.config import Config
 from flask_bcrypt import Bcrypt
 from flask_migrate import Migrate
 from flask_cors import CORS
+from App.cache import RuleCache, ResultCache
+from App.metrics import Metrics
+from App.Api.wrapper.network import RuleNetwork
+from App.Api.wrapper.parallel import SharedRulePool
 
 db = SQLAlchemy()
 jwt = JWTManager()
 bcrypt = Bcrypt()
 migrate = Migrate()
+rule_cache = RuleCache()
+result_cache = ResultCache()
+metrics = Metrics()
+rule_network = RuleNetwork()
+rule_pool = SharedRulePool()
 
 def create_app(config_name=None):
     app = Flask(__name__)
@@ -18,11 +27,21 @@ def create_app(config_name=None):
 
     app.config.from_object(Config)
 
+    # Pool sizing only applies to server databases; in-memory SQLite rejects it
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            key: value for key, value in app.config['SQLALCHEMY_ENGINE_OPTIONS'].items()
+            if key not in ('pool_size', 'max_overflow')
+        }
 
     db.init_app(app)
     jwt.init_app(app)
     migrate.init_app(app, db)
     bcrypt.init_app(app)
+    rule_cache.init_app(app)
+    result_cache.init_app(app)
+    metrics.init_app(app)
+    metrics.add_cache('rule_engine_result_cache', result_cache.stats)
 
     @jwt.token_in_blocklist_loader
     def check_if_token_revoked(jwt_header, jwt_payload):
@@ -31,6 +50,7 @@ def create_app(config_name=None):
 
     from App.Models.NodeModel import NodeModel
     from App.Models.RuleModel import RuleModel
+    from App.Models.RulesVersionModel import RulesVersionModel
 
     with app.app_context():
         db.create_all()
@@ -38,4 +58,7 @@ def create_app(config_name=None):
     from App.Api.route import route
     app.register_blueprint(route, url_prefix='/api/v1')
 
+    from App.cli import rules_cli
+    app.cli.add_command(rules_cli)
+
     return app
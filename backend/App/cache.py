@@ -0,0 +1,137 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+
+# In-process LRU cache of compiled rules keyed by (rule_name, version).
+# `version` is bumped on every invalidation, so a value computed before a
+# rule write can never be stored under the post-write key.
+class RuleCache:
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('RULE_CACHE_SIZE', self.maxsize)
+        self.invalidate()
+
+    def get(self, rule_name):
+        key = (rule_name, self.version)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, rule_name, value, version):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            # Drop values computed against a rule set that has since changed
+            if version != self.version:
+                return
+            key = (rule_name, version)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'version': self.version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Bounded cache of evaluation results keyed by (rule id, values of the
+# attributes the rule reads). Entries are evicted least recently used first
+# and expire `ttl` seconds after they were stored (0: never). A maxsize of
+# 0 disables the cache.
+class ResultCache:
+
+    def __init__(self, maxsize=0, ttl=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('RULE_RESULT_CACHE_SIZE', self.maxsize)
+        self.ttl = app.config.get('RULE_RESULT_CACHE_TTL', self.ttl)
+        self.clear()
+
+    def get(self, key):
+        # Returns (found, value)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        expires_at = monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
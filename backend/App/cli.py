@@ -0,0 +1,205 @@
+import csv
+import json
+import mmap
+import os
+import time
+from collections import deque
+from itertools import islice
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from App.Api.wrapper.vectorized import collect_tokens, records_to_columns
+from App.Api.wrapper.streaming import parse_ndjson_line
+
+rules_cli = AppGroup('rules', help='Rule engine maintenance and bulk jobs.')
+
+
+def mapped_lines(path):
+    # Yields the raw lines of a file through a read-only memory map, so even
+    # very large exports are paged in by the OS rather than read into memory
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, 'rb') as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield from iter(mapped.readline, b'')
+
+
+def read_records(path, input_format):
+    # Yields (record, error) per row. A JSONL line that is not a JSON object
+    # is reported in its row, as /eval/stream reports it, instead of ending
+    # the whole job.
+    lines = mapped_lines(path)
+    if input_format == 'csv':
+        # csv pulls further lines itself for quoted fields spanning lines
+        for record in csv.DictReader(line.decode('utf-8-sig') for line in lines):
+            yield record, None
+        return
+
+    for line in lines:
+        if line.strip():
+            yield parse_ndjson_line(line)
+
+
+def record_chunks(records, tokens, chunk_size, errors):
+    # Groups records into columnar (columns, size) chunks for a RulePool.
+    # Rows that could not be read go out as empty records; their errors are
+    # queued in row order so the output can put them back in place.
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        errors.extend(error for _, error in chunk)
+        yield records_to_columns([record or {} for record, _ in chunk], tokens), len(chunk)
+
+
+def detect_format(path, input_format):
+    if input_format:
+        return input_format
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+@rules_cli.command('evaluate')
+@click.option('--rule', 'rule_names', multiple=True, required=True, help='Rule to evaluate; repeat for several.')
+@click.option('--input', 'input_path', required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--output', 'output_path', required=True, type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'input_format', type=click.Choice(['csv', 'jsonl']), help='Defaults to the input file extension.')
+@click.option('--workers', type=int, help='Worker processes (0: one per CPU, 1: in-process). Defaults to RULE_EVAL_WORKERS.')
+@click.option('--chunk-size', type=click.IntRange(min=1), help='Rows per worker chunk. Defaults to RULE_EVAL_CHUNK_SIZE.')
+def evaluate_file(rule_names, input_path, output_path, input_format, workers, chunk_size):
+    """Evaluate rules against every row of a CSV or JSONL file."""
+    from App.Api.wrapper.utils import load_compiled_rule, evaluate_compiled, open_rule_pool
+    from App.Api.wrapper.parallel import worker_count
+
+    # JSONL results are keyed by rule name
+    duplicates = sorted({rule_name for rule_name in rule_names if rule_names.count(rule_name) > 1})
+    if duplicates:
+        raise click.ClickException(f"--rule given more than once: {', '.join(duplicates)}")
+
+    # Rules are loaded and compiled once, exactly as /eval does
+    compiled_rules = []
+    for rule_name in rule_names:
+        compiled, error, _ = load_compiled_rule(rule_name)
+        if error:
+            raise click.ClickException(error)
+        compiled_rules.append(compiled)
+
+    input_format = detect_format(input_path, input_format)
+    output_format = 'csv' if output_path.lower().endswith('.csv') else 'jsonl'
+
+    if workers is None:
+        workers = current_app.config.get('RULE_EVAL_WORKERS')
+    if chunk_size is None:
+        chunk_size = current_app.config.get('RULE_EVAL_CHUNK_SIZE')
+    records = read_records(input_path, input_format)
+
+    def serial_results():
+        for record, error in records:
+            if error:
+                yield [error] * len(compiled_rules)
+                continue
+            row = []
+            for compiled in compiled_rules:
+                try:
+                    row.append(evaluate_compiled(compiled, record))
+                except ValueError as e:
+                    row.append(str(e))
+            yield row
+
+    def pooled_results(pool):
+        # Workers return one result list per rule; transpose back to rows
+        tokens = set()
+        for compiled in compiled_rules:
+            collect_tokens(compiled.ast, tokens)
+        errors = deque()
+        for chunk_results in pool.map(record_chunks(records, tokens, chunk_size, errors)):
+            for row in zip(*chunk_results):
+                error = errors.popleft()
+                yield [error] * len(compiled_rules) if error else row
+
+    started = time.perf_counter()
+    rows = 0
+    pool = open_rule_pool(compiled_rules, workers) if worker_count(workers) > 1 else None
+    try:
+        with open(output_path, 'w', newline='') as output:
+            writer = csv.writer(output) if output_format == 'csv' else None
+            if writer:
+                writer.writerow(['index', *rule_names])
+
+            for index, row in enumerate(pooled_results(pool) if pool else serial_results()):
+                # Schema and read errors come back as messages in place of a result
+                row = [result if isinstance(result, bool) else f"error: {result}" for result in row]
+                if writer:
+                    writer.writerow([index, *row])
+                else:
+                    output.write(json.dumps({"index": index, "results": dict(zip(rule_names, row))}) + '\n')
+                rows += 1
+    finally:
+        if pool:
+            pool.close()
+
+    elapsed = time.perf_counter() - started
+    throughput = rows / elapsed if elapsed else 0.0
+    click.echo(
+        f"Evaluated {rows} rows against {len(compiled_rules)} rule(s) in {elapsed:.2f}s "
+        f"on {worker_count(workers) if pool else 1} process(es) "
+        f"({throughput:,.0f} rows/s) -> {output_path}"
+    )
+
+
+@rules_cli.command('import')
+@click.option('--input', 'input_path', required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'input_format', type=click.Choice(['csv', 'jsonl']), help='Defaults to the input file extension.')
+def import_file(input_path, input_format):
+    """Create every rule of a CSV or JSONL file with rule_name and rule columns in one transaction."""
+    from App.Api.wrapper.utils import import_rules
+
+    entries = []
+    for index, (entry, error) in enumerate(read_records(input_path, detect_format(input_path, input_format))):
+        if error:
+            raise click.ClickException(f"entry {index + 1}: {error}")
+        entries.append(entry)
+    started = time.perf_counter()
+    # The request size limit only applies to POST /import
+    response, _ = import_rules({"rules": entries}, max_rules=0)
+    elapsed = time.perf_counter() - started
+
+    data = response.get("data")
+    if not data:
+        raise click.ClickException(response["message"])
+    for error in data["errors"]:
+        click.echo(f"entry {error['index'] + 1}: {error['rule_name']!r}: {error['message']}", err=True)
+    click.echo(f"{response['message']} in {elapsed:.2f}s")
+    if data["failed"]:
+        raise click.ClickException(f"{data['failed']} rule(s) were not imported")
+
+
+@rules_cli.command('gc')
+@click.option('--batch-size', type=click.IntRange(min=1), help='Nodes deleted per transaction. Defaults to NODE_GC_BATCH_SIZE.')
+@click.option('--max-batches', type=click.IntRange(min=1), help='Stop after this many batches; resume later with --before.')
+@click.option('--before', type=click.IntRange(min=1), help='Only consider node ids below this one (resumes a stopped run).')
+@click.option('--pause', type=click.FloatRange(min=0), default=0, help='Seconds to sleep between batches.')
+@click.option('--dry-run', is_flag=True, help='Report unreachable nodes without deleting them.')
+def collect_garbage(batch_size, max_batches, before, pause, dry_run):
+    """Delete nodes that no rule reaches any more, in small batches."""
+    from App.Api.wrapper.utils import collect_orphan_nodes
+
+    def progress(report):
+        click.echo(f"batch {report['batches']}: {report['scanned']} scanned, "
+                   f"{report['unreachable']} unreachable, {report['deleted']} deleted")
+
+    started = time.perf_counter()
+    report = collect_orphan_nodes(batch_size, max_batches, before, dry_run, pause, progress)
+    elapsed = time.perf_counter() - started
+
+    click.echo(
+        f"{'Found' if dry_run else 'Deleted'} {report['unreachable'] if dry_run else report['deleted']} "
+        f"unreachable node(s) in {elapsed:.2f}s; {report['reachable']} reachable"
+    )
+    if report['estimated_bytes_reclaimed'] is not None:
+        click.echo(
+            f"~{report['estimated_bytes_reclaimed']:,} of {report['bytes_before']:,} bytes reclaimed "
+            f"(reused by new rows; VACUUM FULL returns them to the OS)"
+        )
+    if report['resume_before']:
+        click.echo(f"Stopped after {report['batches']} batch(es); resume with --before {report['resume_before']}")
@@ -0,0 +1,165 @@
+import os
+from collections import defaultdict
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+from flask import g, has_app_context, request, current_app
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, disable_created_metrics, generate_latest
+from prometheus_client.multiprocess import MultiProcessCollector
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+disable_created_metrics()
+
+
+def multiprocess_dir():
+    # Set by gunicorn.conf.py: every worker process writes its metrics to
+    # files in this directory and a scrape of any worker sums them all
+    return os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+
+# Per-request phase timings of one request, kept on flask.g
+class RequestTimer:
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.phases = defaultdict(float)
+        self.queries = 0
+        self.rule_name = None
+
+
+# Request metrics, rendered in the Prometheus text format. Every request
+# records its total latency, its per-phase latencies and its number of SQL
+# statements; requests slower than RULE_SLOW_LOG_MS are logged with their
+# rule name and phase breakdown. Under gunicorn the metrics of all worker
+# processes are aggregated (prometheus_client multiprocess mode), so every
+# scrape sees the same monotonic counters whichever worker serves it.
+class Metrics:
+
+    def __init__(self):
+        self.slow_log_ms = 0
+        self.registry = CollectorRegistry()
+        self._lock = Lock()
+        # prefix -> [stats, counters, size gauge, values already counted]
+        self._caches = {}
+        self.requests = Counter(
+            'rule_engine_requests', 'Requests served', ('path', 'method', 'status'), registry=self.registry
+        )
+        self.queries = Counter(
+            'rule_engine_db_queries', 'SQL statements executed', ('path',), registry=self.registry
+        )
+        self.request_latency = Histogram(
+            'rule_engine_request_duration_seconds', 'Request latency', ('path', 'method'),
+            registry=self.registry, buckets=LATENCY_BUCKETS
+        )
+        self.phase_latency = Histogram(
+            'rule_engine_phase_duration_seconds', 'Latency of each request phase', ('path', 'phase'),
+            registry=self.registry, buckets=LATENCY_BUCKETS
+        )
+        self.request_queries = Histogram(
+            'rule_engine_request_queries', 'SQL statements per request', ('path',),
+            registry=self.registry, buckets=QUERY_BUCKETS
+        )
+
+    def init_app(self, app):
+        self.slow_log_ms = app.config.get('RULE_SLOW_LOG_MS', self.slow_log_ms)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def _start(self):
+        g.request_timer = RequestTimer()
+
+    def _finish(self, response):
+        timer = g.pop('request_timer', None)
+        if timer is None:
+            return response
+        elapsed = perf_counter() - timer.started
+        path = request.url_rule.rule if request.url_rule else 'unmatched'
+
+        self.requests.labels(path, request.method, str(response.status_code)).inc()
+        self.request_latency.labels(path, request.method).observe(elapsed)
+        for phase, seconds in timer.phases.items():
+            self.phase_latency.labels(path, phase).observe(seconds)
+        self.request_queries.labels(path).observe(timer.queries)
+        self.queries.labels(path).inc(timer.queries)
+        self._sample_caches()
+
+        if self.slow_log_ms and elapsed * 1000 >= self.slow_log_ms:
+            phases = ', '.join(f"{phase}={seconds * 1000:.1f}ms" for phase, seconds in timer.phases.items())
+            current_app.logger.warning(
+                f"Slow request {request.method} {path} rule={timer.rule_name!r}: "
+                f"{elapsed * 1000:.1f}ms, {timer.queries} queries ({phases or 'no phases'})"
+            )
+        return response
+
+    def add_cache(self, prefix, stats):
+        # stats() returns the cache's cumulative hits, misses and evictions
+        # and its current size. They are copied into metrics after every
+        # request, so the caches of all worker processes add up. Adding a
+        # prefix again (another create_app) switches it to the new stats.
+        with self._lock:
+            if prefix in self._caches:
+                cache = self._caches[prefix]
+                cache[0] = stats
+                cache[3] = stats()
+                return
+            counters = {
+                name: Counter(f'{prefix}_{name}', f'Cache {name}', registry=self.registry)
+                for name in ('hits', 'misses', 'evictions')
+            }
+            size = Gauge(f'{prefix}_size', 'Cache entries', registry=self.registry, multiprocess_mode='livesum')
+            self._caches[prefix] = [stats, counters, size, dict.fromkeys(counters, 0)]
+
+    def _sample_caches(self):
+        with self._lock:
+            for stats, counters, size, seen in self._caches.values():
+                values = stats()
+                for name, counter in counters.items():
+                    if values[name] > seen[name]:
+                        counter.inc(values[name] - seen[name])
+                        seen[name] = values[name]
+                size.set(values['size'])
+
+    def render(self):
+        self._sample_caches()
+        if not multiprocess_dir():
+            return generate_latest(self.registry)
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+        return generate_latest(registry)
+
+
+def current_timer():
+    return g.get('request_timer') if has_app_context() else None
+
+
+@contextmanager
+def timed(phase):
+    # Adds the duration of the block to `phase` of the current request; a
+    # no-op outside requests (CLI jobs, process-pool workers)
+    timer = current_timer()
+    if timer is None:
+        yield
+        return
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        timer.phases[phase] += perf_counter() - started
+
+
+def set_rule_name(rule_name):
+    timer = current_timer()
+    if timer is not None:
+        timer.rule_name = rule_name
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_query(*args):
+    timer = current_timer()
+    if timer is not None:
+        timer.queries += 1
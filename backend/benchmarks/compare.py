@@ -0,0 +1,69 @@
+import argparse
+import json
+import sys
+
+
+def change(baseline, candidate):
+    if not baseline:
+        return None
+    return (candidate - baseline) / baseline
+
+
+def format_change(value):
+    return '     n/a' if value is None else f"{value * 100:+7.1f}%"
+
+
+def compare(baseline, candidate, threshold):
+    # Returns the names of the cases that regressed: throughput dropped by
+    # more than `threshold`, or more queries are issued per operation
+    regressions = []
+    baseline_results = baseline['results']
+    candidate_results = candidate['results']
+
+    print(f"{'case':<44} {'base ops/s':>12} {'new ops/s':>12} {'ops/s':>8} {'p99':>8} {'queries':>9}")
+    for case in baseline_results:
+        if case not in candidate_results:
+            print(f"{case:<44} missing from candidate")
+            continue
+        before, after = baseline_results[case], candidate_results[case]
+        throughput = change(before['ops_per_sec'], after['ops_per_sec'])
+        latency = change(before['p99_ms'], after['p99_ms'])
+        queries = after['queries_per_op'] - before['queries_per_op']
+
+        regressed = (throughput is not None and throughput < -threshold) or queries > 0
+        if regressed:
+            regressions.append(case)
+        print(
+            f"{case:<44} {before['ops_per_sec']:>12,.1f} {after['ops_per_sec']:>12,.1f} "
+            f"{format_change(throughput)} {format_change(latency)} {queries:>+9.2f}"
+            f"{'  REGRESSION' if regressed else ''}"
+        )
+
+    for case in candidate_results:
+        if case not in baseline_results:
+            print(f"{case:<44} new in candidate")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files.')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Allowed throughput drop (default: 0.10)')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as baseline_file, open(args.candidate) as candidate_file:
+        baseline, candidate = json.load(baseline_file), json.load(candidate_file)
+
+    for label, report in (('baseline', baseline), ('candidate', candidate)):
+        meta = report.get('meta', {})
+        print(f"{label}: {meta.get('git_revision')} python {meta.get('python')} on {meta.get('database')}, scale {meta.get('scale')}")
+
+    regressions = compare(baseline, candidate, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
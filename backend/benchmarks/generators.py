@@ -0,0 +1,43 @@
+NUMERIC_ATTRIBUTES = [f'n{index}' for index in range(8)]
+STRING_ATTRIBUTES = [f's{index}' for index in range(4)]
+STRING_VALUES = ['sales', 'marketing', 'hr', 'finance', 'support']
+
+
+def comparison(rng):
+    if rng.random() < 0.7:
+        operator = rng.choice(['>', '<', '>=', '<=', '='])
+        return f"{rng.choice(NUMERIC_ATTRIBUTES)} {operator} {rng.randint(0, 100)}"
+    return f"{rng.choice(STRING_ATTRIBUTES)} = '{rng.choice(STRING_VALUES)}'"
+
+
+def balanced_rule(rng, size):
+    # `size` comparisons joined into a balanced tree of depth ~log2(size)
+    if size == 1:
+        return comparison(rng)
+    left_size = size // 2
+    operator = rng.choice(['AND', 'OR'])
+    return f"({balanced_rule(rng, left_size)} {operator} {balanced_rule(rng, size - left_size)})"
+
+
+def deep_rule(rng, size):
+    # `size` comparisons nested to the right, so the depth grows with size
+    rule = comparison(rng)
+    for _ in range(size - 1):
+        rule = f"{comparison(rng)} {rng.choice(['AND', 'OR'])} ({rule})"
+    return rule
+
+
+def generate_rule(rng, size, shape):
+    rule = balanced_rule(rng, size) if shape == 'balanced' else deep_rule(rng, size)
+    # The parser requires a logical operator even for a single comparison
+    return rule if size > 1 else f"{rule} AND {comparison(rng)}"
+
+
+def generate_record(rng):
+    record = {attribute: rng.randint(0, 100) for attribute in NUMERIC_ATTRIBUTES}
+    record.update({attribute: rng.choice(STRING_VALUES) for attribute in STRING_ATTRIBUTES})
+    return record
+
+
+def generate_records(rng, count):
+    return [generate_record(rng) for _ in range(count)]
@@ -0,0 +1,67 @@
+import gc
+import time
+import tracemalloc
+from sqlalchemy import event
+
+# Memory is traced over a few extra runs only, so tracemalloc's overhead
+# never shows up in the timings
+MEMORY_RUNS = 5
+
+
+class QueryCounter:
+    # Counts the SQL statements sent through an engine
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def measure(operation, iterations, queries, setup=None, warmup=3):
+    # operation(state) is timed; setup(), when given, runs untimed before
+    # every call and returns its state
+    def run():
+        state = setup() if setup else None
+        started = time.perf_counter()
+        operation(state)
+        return time.perf_counter() - started
+
+    for _ in range(warmup):
+        run()
+
+    gc.collect()
+    gc.disable()
+    try:
+        queries_before = queries.count
+        samples = [run() for _ in range(iterations)]
+        query_count = queries.count - queries_before
+    finally:
+        gc.enable()
+
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        for _ in range(min(MEMORY_RUNS, iterations)):
+            run()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+    total = sum(samples)
+    return {
+        "iterations": iterations,
+        "ops_per_sec": iterations / total if total else None,
+        "mean_ms": total / iterations * 1000,
+        "p50_ms": percentile(samples, 0.50) * 1000,
+        "p99_ms": percentile(samples, 0.99) * 1000,
+        "queries_per_op": query_count / iterations,
+        "peak_memory_kb": max(peak, 0) / 1024,
+    }
@@ -0,0 +1,163 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+from benchmarks.generators import generate_rule, generate_records
+from benchmarks.harness import QueryCounter, measure
+
+# Usage, from backend/:
+#   python -m benchmarks.run --output baseline.json
+#   python -m benchmarks.compare baseline.json candidate.json
+RULE_SIZES = [2, 8, 32, 128]
+SHAPES = ['balanced', 'deep']
+COMBINE_SIZES = [2, 8, 32]
+BATCH_SIZES = [100, 1000, 10000]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scale, seed, only=None):
+    from App import create_app, db, rule_cache
+    from App.Api.wrapper.utils import (
+        parse_rule_to_postfix,
+        create_rule,
+        combine_rules,
+        reconstruct_ast,
+        evaluate_ast,
+        load_compiled_rule,
+        evaluate_compiled,
+        evaluate_rule_batch,
+    )
+
+    rng = random.Random(seed)
+    names = (f'rule_{index}' for index in itertools.count())
+    results = {}
+
+    def iterations(count):
+        return max(1, int(count * scale))
+
+    def bench(case, operation, count, setup=None):
+        if only and not any(pattern in case for pattern in only):
+            return
+        results[case] = measure(operation, iterations(count), queries, setup)
+        metrics = results[case]
+        print(
+            f"{case:<44} {metrics['ops_per_sec']:>12,.1f} ops/s  p50 {metrics['p50_ms']:>9.3f} ms  "
+            f"p99 {metrics['p99_ms']:>9.3f} ms  {metrics['queries_per_op']:>6.2f} q/op  "
+            f"{metrics['peak_memory_kb']:>9.1f} KiB"
+        )
+
+    def new_rule(size, shape='balanced'):
+        name = next(names)
+        response, status = create_rule({'rule_name': name, 'rule': generate_rule(rng, size, shape)})
+        assert status == 201, response
+        return name
+
+    app = create_app()
+    with app.app_context():
+        queries = QueryCounter(db.engine)
+        records = generate_records(rng, 1000)
+        record_cycle = itertools.cycle(records)
+
+        for shape, size in itertools.product(SHAPES, RULE_SIZES):
+            suffix = f"[{shape},size={size}]"
+            # Seeded per group, so --only selections see the same rules
+            rng.seed(f"{seed}:{suffix}")
+
+            # Distinct rule text every call, so the parse cache never hits
+            bench(f"parse.cold{suffix}", parse_rule_to_postfix, 500,
+                  setup=lambda: generate_rule(rng, size, shape))
+            cached_rule = generate_rule(rng, size, shape)
+            bench(f"parse.cached{suffix}", lambda _: parse_rule_to_postfix(cached_rule), 2000)
+
+            def create(data):
+                response, status = create_rule(data)
+                assert status == 201, response
+            bench(f"create_rule{suffix}", create, 100,
+                  setup=lambda: {'rule_name': next(names), 'rule': generate_rule(rng, size, shape)})
+
+            rule_name = new_rule(size, shape)
+            compiled, _, _ = load_compiled_rule(rule_name)
+            root = db.session.execute(
+                db.text('SELECT root FROM rules WHERE rule_name = :name'), {'name': rule_name}
+            ).scalar()
+            bench(f"reconstruct_ast{suffix}", lambda _: reconstruct_ast(root), 200)
+
+            def load_cold(_):
+                compiled, error, _ = load_compiled_rule(rule_name)
+                assert not error, error
+            bench(f"load_compiled_rule.cold{suffix}", load_cold, 200, setup=rule_cache.invalidate)
+
+            tree = reconstruct_ast(root)
+            bench(f"evaluate_ast{suffix}", lambda record: evaluate_ast(tree, record), 2000,
+                  setup=lambda: next(record_cycle))
+            bench(f"evaluate_compiled{suffix}", lambda record: evaluate_compiled(compiled, record), 2000,
+                  setup=lambda: next(record_cycle))
+
+        for count in COMBINE_SIZES:
+            rng.seed(f"{seed}:combine:{count}")
+            def combine(data):
+                response, status = combine_rules(data)
+                assert status == 201, response
+            bench(f"combine_rules[rules={count}]", combine, 50,
+                  setup=lambda: {'rule_name': next(names), 'rules': [generate_rule(rng, 4, 'balanced') for _ in range(count)]})
+
+        rng.seed(f"{seed}:batch")
+        batch_rule = new_rule(8)
+        for count in BATCH_SIZES:
+            batch = generate_records(rng, count)
+
+            def evaluate_batch(_):
+                response, status = evaluate_rule_batch({'rule_name': batch_rule, 'records': batch})
+                assert status == 200, response
+            bench(f"evaluate_rule_batch[records={count}]", evaluate_batch, max(5, 20000 // count))
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the parse, persist and evaluate paths.')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--database', default='sqlite://', help='Database URL (default: in-memory SQLite)')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier for the iteration counts')
+    parser.add_argument('--quick', action='store_true', help='Shorthand for --scale 0.1')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--only', action='append', help='Only run cases whose name contains this text')
+    args = parser.parse_args(argv)
+
+    # App.config reads the database URL at import time
+    os.environ['DATABASE_URL'] = args.database
+    scale = 0.1 if args.quick else args.scale
+    results = run_benchmarks(scale, args.seed, args.only)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "database": args.database.split(':', 1)[0],
+            "scale": scale,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
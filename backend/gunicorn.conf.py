@@ -0,0 +1,43 @@
+import multiprocessing
+import os
+import tempfile
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+
+# Every worker is a separate process with its own rule cache and its own
+# SQLAlchemy pool, so /eval requests are served in parallel. Keep
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) below the database's
+# max_connections.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Seen by the app, which sizes each worker's evaluation pool from it
+os.environ['WEB_CONCURRENCY'] = str(workers)
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+keepalive = 5
+
+# The app is created in each worker, after the fork, so no database
+# connection is ever shared between processes
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
+
+# Request metrics are aggregated across workers by prometheus_client's
+# multiprocess mode, through files in this directory; it must be set before
+# the workers import the app. Stale files of a previous run are removed.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', tempfile.mkdtemp(prefix='rule_engine_metrics_'))
+
+
+def on_starting(server):
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    os.makedirs(metrics_dir, exist_ok=True)
+    for name in os.listdir(metrics_dir):
+        if name.endswith('.db'):
+            os.remove(os.path.join(metrics_dir, name))
+
+
+def child_exit(server, worker):
+    # Live gauges of an exited worker no longer count; its counters do
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,70 @@
+"""add content digest to nodes
+
+Revision ID: 3f9c2a7d41b8
+Revises: 
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+import hashlib
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a7d41b8'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _digest(elem_type, value, left_digest, right_digest):
+    # Must stay in sync with App.Models.NodeModel.node_digest
+    content = json.dumps([elem_type, value, left_digest, right_digest])
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def upgrade():
+    bind = op.get_bind()
+    # Tables created by db.create_all() on a fresh install already have it
+    columns = [column['name'] for column in sa.inspect(bind).get_columns('nodes')]
+    if 'digest' not in columns:
+        with op.batch_alter_table('nodes', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('digest', sa.String(length=64), nullable=True))
+            batch_op.create_index(batch_op.f('ix_nodes_digest'), ['digest'], unique=False)
+
+    # Children are always inserted before their parents, so walking the table
+    # in id order sees every child digest before it is needed
+    nodes = sa.table(
+        'nodes',
+        sa.column('id', sa.Integer),
+        sa.column('elem_type', sa.Integer),
+        sa.column('value', sa.String),
+        sa.column('left', sa.Integer),
+        sa.column('right', sa.Integer),
+        sa.column('digest', sa.String),
+    )
+    digests = {}
+    updates = []
+    rows = bind.execute(
+        sa.select(nodes.c.id, nodes.c.elem_type, nodes.c.value, nodes.c.left, nodes.c.right, nodes.c.digest)
+        .order_by(nodes.c.id)
+    )
+    for row in rows:
+        digest = row.digest or _digest(row.elem_type, row.value, digests.get(row.left), digests.get(row.right))
+        digests[row.id] = digest
+        if row.digest is None:
+            updates.append({'node_id': row.id, 'node_digest': digest})
+
+    if updates:
+        bind.execute(
+            nodes.update().where(nodes.c.id == sa.bindparam('node_id')).values(digest=sa.bindparam('node_digest')),
+            updates
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('nodes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_nodes_digest'))
+        batch_op.drop_column('digest')
@@ -0,0 +1,36 @@
+"""add rules table version counter
+
+Revision ID: 8b1e4c6f2a90
+Revises: 3f9c2a7d41b8
+Create Date: 2026-10-18 14:03:27.604113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b1e4c6f2a90'
+down_revision = '3f9c2a7d41b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    # Tables created by db.create_all() on a fresh install already have it
+    if not sa.inspect(bind).has_table('rules_version'):
+        op.create_table(
+            'rules_version',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+    rules_version = sa.table('rules_version', sa.column('id', sa.Integer), sa.column('version', sa.Integer))
+    if bind.execute(sa.select(rules_version.c.id).where(rules_version.c.id == 1)).first() is None:
+        op.bulk_insert(rules_version, [{'id': 1, 'version': 1}])
+
+
+def downgrade():
+    op.drop_table('rules_version')
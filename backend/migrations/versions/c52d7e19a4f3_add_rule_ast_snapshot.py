@@ -0,0 +1,87 @@
+"""add serialized AST snapshot to rules
+
+Revision ID: c52d7e19a4f3
+Revises: 8b1e4c6f2a90
+Create Date: 2026-10-18 15:21:09.117482
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52d7e19a4f3'
+down_revision = '8b1e4c6f2a90'
+branch_labels = None
+depends_on = None
+
+
+def _snapshot(root_id, nodes_by_id):
+    # Must stay in sync with App.Api.wrapper.snapshot.encode_snapshot:
+    # children first, root last, shared subtrees listed once
+    positions = {}
+    entries = []
+    stack = [(root_id, False)]
+    while stack:
+        node_id, children_done = stack.pop()
+        if node_id in positions or node_id not in nodes_by_id:
+            continue
+        elem_type, value, left, right = nodes_by_id[node_id]
+        if not children_done:
+            stack.append((node_id, True))
+            for child in (right, left):
+                if child is not None and child not in positions:
+                    stack.append((child, False))
+            continue
+        if any(child is not None and child not in positions for child in (left, right)):
+            return None
+        positions[node_id] = len(entries)
+        entries.append([node_id, elem_type, value, positions.get(left), positions.get(right)])
+    if root_id not in positions:
+        return None
+    return {'v': 1, 'nodes': entries}
+
+
+def upgrade():
+    bind = op.get_bind()
+    # Tables created by db.create_all() on a fresh install already have it
+    columns = [column['name'] for column in sa.inspect(bind).get_columns('rules')]
+    if 'ast_snapshot' not in columns:
+        with op.batch_alter_table('rules', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('ast_snapshot', sa.JSON(), nullable=True))
+
+    rules = sa.table('rules', sa.column('id', sa.Integer), sa.column('root', sa.Integer), sa.column('ast_snapshot', sa.JSON))
+    nodes = sa.table(
+        'nodes',
+        sa.column('id', sa.Integer),
+        sa.column('elem_type', sa.Integer),
+        sa.column('value', sa.String),
+        sa.column('left', sa.Integer),
+        sa.column('right', sa.Integer),
+    )
+    pending = bind.execute(sa.select(rules.c.id, rules.c.root).where(rules.c.ast_snapshot.is_(None))).all()
+    if not pending:
+        return
+
+    nodes_by_id = {
+        row.id: (row.elem_type, row.value, row.left, row.right)
+        for row in bind.execute(sa.select(nodes.c.id, nodes.c.elem_type, nodes.c.value, nodes.c.left, nodes.c.right))
+    }
+    updates = []
+    for rule in pending:
+        snapshot = _snapshot(rule.root, nodes_by_id)
+        # A rule whose tree is incomplete keeps no snapshot and is loaded
+        # from its postfix expression
+        if snapshot is not None:
+            updates.append({'rule_id': rule.id, 'snapshot': snapshot})
+
+    if updates:
+        bind.execute(
+            rules.update().where(rules.c.id == sa.bindparam('rule_id')).values(ast_snapshot=sa.bindparam('snapshot')),
+            updates
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('rules', schema=None) as batch_op:
+        batch_op.drop_column('ast_snapshot')
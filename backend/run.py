@@ -1,6 +1,13 @@
+import os
 from App import create_app
+from App.config import env_bool, env_int
 
 app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Development server only; use `gunicorn -c gunicorn.conf.py wsgi:app` in production
+    app.run(
+        host=os.environ.get('HOST', '127.0.0.1'),
+        port=env_int('PORT', 5000),
+        debug=env_bool('FLASK_DEBUG', False)
+    )
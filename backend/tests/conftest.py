@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+# The App package lives in backend/, the parent of this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app(monkeypatch):
+    # A fresh in-memory SQLite database per test
+    from App.config import Config
+    monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', 'sqlite://')
+    from App import create_app
+    app = create_app()
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
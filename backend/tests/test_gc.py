@@ -0,0 +1,66 @@
+from App import db
+from App.Api.wrapper.utils import collect_orphan_nodes, evaluate_ast, reconstruct_ast
+from App.Models.NodeModel import NodeModel
+from App.Models.RuleModel import RuleModel
+
+SHARED = "(age > 30 AND dept = 'sales')"
+
+RULES = {
+    'deleted': f"{SHARED} OR salary > 50000",
+    'survivor': f"{SHARED} AND experience > 5",
+    # Hash-consed onto the same nodes as 'deleted'
+    'twin': f"{SHARED} OR salary > 50000",
+}
+
+RECORDS = [
+    {'age': 35, 'dept': 'Sales', 'salary': 60000, 'experience': 6},
+    {'age': 35, 'dept': 'sales', 'salary': 1000, 'experience': 2},
+    {'age': 25, 'dept': 'hr', 'salary': 60000, 'experience': 10},
+    {'age': '40', 'dept': 'SALES', 'experience': '7'},
+    {},
+]
+
+
+def subtree_ids(ast):
+    if not ast:
+        return set()
+    return {ast['id']} | subtree_ids(ast['left']) | subtree_ids(ast['right'])
+
+
+def test_gc_keeps_live_and_shared_subtrees(client):
+    for rule_name, rule in RULES.items():
+        response = client.post('/api/v1/create', json={'rule_name': rule_name, 'rule': rule})
+        assert response.status_code == 201
+
+    rules = {rule_name: RuleModel.find_one({'rule_name': rule_name}) for rule_name in RULES}
+    before = {rule_name: reconstruct_ast(rule.root) for rule_name, rule in rules.items()}
+    assert rules['twin'].root == rules['deleted'].root
+    shared = subtree_ids(before['deleted']) & subtree_ids(before['survivor'])
+    assert shared
+
+    # Nothing is collected while every rule is live
+    assert collect_orphan_nodes()['deleted'] == 0
+
+    db.session.delete(rules['deleted'])
+    db.session.delete(rules['twin'])
+    db.session.commit()
+    exclusive = subtree_ids(before['deleted']) - subtree_ids(before['survivor'])
+    assert exclusive
+
+    report = collect_orphan_nodes(batch_size=2)
+    assert report['deleted'] == len(exclusive)
+    assert report['reachable'] == len(subtree_ids(before['survivor']))
+
+    remaining = {node.id for node in NodeModel.query.all()}
+    assert remaining == subtree_ids(before['survivor'])
+    assert shared <= remaining
+
+    survivor = reconstruct_ast(rules['survivor'].root)
+    assert survivor == before['survivor']
+    for record in RECORDS:
+        assert evaluate_ast(survivor, record) == evaluate_ast(before['survivor'], record)
+        response = client.post('/api/v1/eval', json={'rule_name': 'survivor', 'conditions': record or {'zip': 1}})
+        assert response.get_json()['data']['evaluation_result'] == evaluate_ast(survivor, record)
+
+    # A second sweep finds nothing left to delete
+    assert collect_orphan_nodes()['unreachable'] == 0
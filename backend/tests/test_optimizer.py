@@ -0,0 +1,156 @@
+import random
+
+import pytest
+
+from App.Api.wrapper.codegen import compile_function
+from App.Api.wrapper.optimizer import ALWAYS_FALSE, ALWAYS_TRUE, optimize_postfix
+from App.Api.wrapper.utils import build_ast_from_postfix, evaluate_ast, parse_rule_to_postfix
+from App.Api.wrapper.vm import compile_program, run_program
+
+ATTRIBUTES = ['age', 'dept', 'salary', 'name']
+
+# Numbers, numeric strings, strings that only look numeric to float() and
+# values that never compare, so every mix of operand types is exercised
+VALUES = [
+    None, True, False, 0, 5, 20, 30, 30.0, 35, 40, -1.5, 1e9,
+    '30', '5', ' 5 ', '1e1', '30.0', 'nan', 'inf', '-inf', '\x1c5',
+    'abc', 'Sales', 'sales', 'SALES', 'b', 'a', '', [1], {'a': 1},
+]
+
+RULES = [
+    # Flattening and duplicates
+    "(age > 30 AND (dept = 'sales' AND salary > 5))",
+    "(age > 30 OR (dept = 'sales' OR salary > 5))",
+    "age > 30 AND age > 30",
+    "(age > 30 AND dept = 'sales') OR (dept = 'sales' AND age > 30)",
+    "(age > 30 OR salary < 5) AND (salary < 5 OR age > 30)",
+    # Range merging on one attribute
+    "age > 30 AND age > 40",
+    "age > 30 OR age > 40",
+    "age >= 30 AND age <= 30",
+    "age < 30 AND age <= 30",
+    "age = 5 AND age > 3",
+    "age = 5 OR age > 3",
+    "age >= 5 AND age = 5",
+    "age > 5 AND age < 10 AND age > 7",
+    "age < 5 OR age < 10 OR age <= 10",
+    # Contradictions and tautologies over possibly missing or non-numeric values
+    "age > 30 AND age < 20",
+    "age = 5 AND age = 6",
+    "age > 30 OR age <= 30",
+    "age = 5 OR age < 5 OR age > 5",
+    "age > 30 AND age <= 30",
+    # String literals next to numeric ones
+    "dept = 'sales' AND dept = 'Sales'",
+    "dept = 'sales' AND dept = 'hr'",
+    "dept = 'sales' OR dept = 'SALES'",
+    "age > '30' AND age < 'abc'",
+    "age = 5 AND age = '5'",
+    "age = '5' OR age = 'five'",
+    "name > 'b' AND name < 'a'",
+    "name >= 'b' AND name <= 'b'",
+    "age > 30 AND age > 'x'",
+    "age < 'x' OR age > 30",
+    "salary > 1e1 AND salary > 10",
+    "salary = 10 AND salary = 1e1",
+    # Comparisons between constants
+    "1 = 1 AND age > 3",
+    "1 = 2 OR age > 3",
+    "5 > 'x' AND age = 1",
+    "'a' = 'a' OR age > 3",
+    "'a' < 'b' AND 3 < 2",
+    "5 >= 5 AND 'x' = 'X'",
+]
+
+
+def random_rule(rng, depth):
+    if depth == 0 or rng.random() < 0.3:
+        attribute = rng.choice(ATTRIBUTES)
+        operator = rng.choice(['>', '<', '=', '>=', '<='])
+        literal = rng.choice(['1', '5', '30', "'5'", "'x'", "'sales'", '0', '1e1'])
+        return f"{attribute} {operator} {literal}"
+    left, right = random_rule(rng, depth - 1), random_rule(rng, depth - 1)
+    return f"({left} {rng.choice(['AND', 'OR'])} {right})"
+
+
+def random_records(rng, count):
+    # Record keys are attribute names only: a key equal to a literal token
+    # would change what the literal means, which no optimization can honour
+    return [
+        {attribute: rng.choice(VALUES) for attribute in ATTRIBUTES if rng.random() < 0.8}
+        for _ in range(count)
+    ]
+
+
+def evaluators(postfix):
+    ast = build_ast_from_postfix(postfix)
+    program = compile_program(ast)
+    function = compile_function(ast, None, 'rule')
+    return {
+        'ast': lambda record: evaluate_ast(ast, record),
+        'vm': lambda record: run_program(program, record),
+        'python': function,
+    }
+
+
+def assert_equivalent(rule, records):
+    postfix = parse_rule_to_postfix(rule)
+    assert postfix, rule
+    optimized, report = optimize_postfix(postfix)
+    assert report.nodes_after <= report.nodes_before
+
+    original, simplified = evaluators(postfix), evaluators(optimized)
+    for record in records:
+        expected = original['ast'](record)
+        for name, evaluate in simplified.items():
+            assert bool(evaluate(record)) == bool(expected), (rule, optimized, name, record)
+        assert bool(original['vm'](record)) == bool(expected), (rule, record)
+    return optimized, report
+
+
+@pytest.mark.parametrize('rule', RULES)
+def test_optimized_rule_evaluates_like_the_original(rule):
+    assert_equivalent(rule, random_records(random.Random(rule), 400))
+
+
+def test_random_rules_evaluate_like_the_original():
+    rng = random.Random(2024)
+    for _ in range(300):
+        rule = random_rule(rng, 4)
+        if ' AND ' not in rule and ' OR ' not in rule:
+            rule = f"{rule} AND age > 0"
+        assert_equivalent(rule, random_records(rng, 40))
+
+
+@pytest.mark.parametrize('rule, constant', [
+    ("age > 30 AND age < 20", False),
+    ("1 = 2 AND age > 3", False),
+    ("1 = 1 OR age > 3", True),
+])
+def test_constant_rules_fold(rule, constant):
+    optimized, report = assert_equivalent(rule, random_records(random.Random(rule), 400))
+    assert report.constant is constant
+    assert optimized == (ALWAYS_TRUE if constant else ALWAYS_FALSE)
+
+
+@pytest.mark.parametrize('rule', [
+    # Missing or non-numeric values fail both sides, so these are not True
+    "age > 30 OR age <= 30",
+    "age = 5 OR age < 5 OR age > 5",
+])
+def test_rules_true_only_for_numbers_do_not_fold(rule):
+    _, report = assert_equivalent(rule, random_records(random.Random(rule), 400))
+    assert report.constant is None
+
+
+def test_optimized_rule_is_stored_and_evaluated(client):
+    rule = "(age > 30 AND age > 40) AND (dept = 'sales' OR dept = 'sales')"
+    response = client.post('/api/v1/create', json={'rule_name': 'optimized', 'rule': rule})
+    assert response.status_code == 201
+    body = response.get_json()
+    assert body['optimization']['nodes_after'] < body['optimization']['nodes_before']
+
+    original = build_ast_from_postfix(parse_rule_to_postfix(rule))
+    for record in random_records(random.Random(rule), 100):
+        response = client.post('/api/v1/eval', json={'rule_name': 'optimized', 'conditions': record or {'zip': 1}})
+        assert response.get_json()['data']['evaluation_result'] == evaluate_ast(original, record)